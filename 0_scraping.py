@@ -1,180 +1,332 @@
-import requests
 from bs4 import BeautifulSoup
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import hashlib
 import os
 import json
-
-"""# Extraer urls de recetas de cookpad"""
-
-cookpad_urls_files_directory = '/raw/cookpad-urls'
-
-for a in range(0,13):
-  response = requests.get(f"https://cookpad.com/ar/buscar/argentina?page={a}", headers={
-      "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-  })
-  soup = BeautifulSoup(response.content, "html.parser")
-  links = soup.find_all("a", class_="block-link__main")
-
-  if(len(links)):
-    hrefs = [link.get("href") for link in links]
+import socket
+import subprocess
+import sys
+import time
+from common.crawler import Crawler
+from common.frontier import Frontier, PENDING, DONE, FAILED, DEAD
+from common.pack import Pack, decode_html
+from common.parsing import DEFAULT_PARSER, extraction_version
+from common.records import append_record
+from common.sitemap import SitemapParser
+from common.sites import SITES
+
+raw_directory = '/raw'
+# Server every request is sent to instead of the real sites, if any
+base_url = None
+
+frontier = None
+packs = {}
+# Discovered urls are queued for download right away, except in the discovery phase of a distributed crawl
+fetch_discovered = True
+# Record files per site when recipes are extracted at fetch time, empty otherwise
+records_files = {}
+# Extraction version stamped on the records, computed once when extraction is on
+records_version = None
+# Processes parsing the fetched pages off the event loop, 0 parses them on it
+parse_workers = 1
+
+# Links of a listing page. Runs in the parsing processes.
+def listing_links(site_name, body):
+  return SITES[site_name].links(BeautifulSoup(body, "html.parser"))
+
+# Cheap check of the raw page before parsing it: a page without the first class of the site's recipe marker
+# anywhere in its bytes cannot pass the validator
+def may_be_recipe(site, html):
+  return site.recipe_marker[1].split()[0].encode() in html
+
+# Whether a page is a recipe and, with extract, its record, or why it could not be extracted: (is_recipe, recipe, error).
+# A failed extraction does not change the validation, so the page is still saved. Runs in the parsing processes.
+def check_recipe_page(site_name, html, name, extract):
+  site = SITES[site_name]
+  text, error = html, None
+  if extract:
+    # Parse the decoded text like the cleaning stage does so the extracted record is identical to its output
+    try:
+      text = decode_html(html)
+    except UnicodeDecodeError as e:
+      error = f'{type(e).__name__}: {e}'
+  soup = BeautifulSoup(text, "html.parser")
+  if not site.is_recipe(soup):
+    return False, None, None
+  if not extract or error:
+    return True, None, error
+  try:
+    return True, site.extract(soup, name), None
+  except Exception as e:
+    return True, None, f'{type(e).__name__}: {e}'
+
+# Save the links found on a listing page and return them
+def save_links(site, hrefs, page):
+  if(len(hrefs)):
     soupFile = json.dumps(hrefs)
-    with open(f'{cookpad_urls_files_directory}/output-cookpad-{a}.json', 'w') as f:
+    with open(os.path.join(raw_directory, f'{site.name}-urls', site.listing_file_name(page)), 'w') as f:
           f.write(soupFile)
+    return hrefs
   else:
-    print('No links', a)
-
-"""# Descargar las recetas de cookpad"""
-
-cookpad_urls_files_directory = '/raw/cookpad-urls'
-cookpad_html_files_directory = '/raw/cookpad-html'
-
-already_scrapped = []
-all_urls = []
-
-with open(os.path.join(cookpad_urls_files_directory, 'output-already-scrapped-cookpad.json'), 'r', encoding='utf-8') as file:
-        already_scrapped.extend(json.load(file))
-
-for file_name in os.listdir(cookpad_urls_files_directory):
-      with open(os.path.join(cookpad_urls_files_directory, file_name), 'r', encoding='utf-8') as file:
-        all_urls.extend(json.load(file))
-
-def scraper(url):
-    response = requests.get(f'https://cookpad.com/{url}', headers={
-      "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    })
-    html = response.content
-    soup = BeautifulSoup(html, "html.parser")
-    find = soup.find_all("div", class_="text-cookpad-gray-500")
-    if(len(find)):
-      with open(f'{cookpad_html_files_directory}/{url.replace("/ar/recetas/","")}.html', 'wb') as f:
-          f.write(html)
-
-      return True
-    else:
-      print('No recipe', url)
-      return False
-
-for url in all_urls:
-  if url not in already_scrapped:
-    result = scraper(url)
-
-    if(result):
-      already_scrapped.append(url)
-    else:
-      already_scrapped_json = json.dumps(already_scrapped)
-      with open(f'{cookpad_urls_files_directory}/output-already-scrapped-cookpad.json', 'w') as f:
-          f.write(already_scrapped_json)
-      break
-
-"""# Extraer URLs de Recetasgratis.net"""
-
-recetasgratis_urls_files_directory = '/raw/recetasgratis-urls'
-
-for a in range(0,7):
-  response = requests.get(f"https://www.recetasgratis.net/recetas-argentinas{f'/{a}' if a > 0 else ''}", headers={
-      "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-  })
-  soup = BeautifulSoup(response.content, "html.parser")
-  links = soup.find_all("a", class_="titulo titulo--resultado")
-
-  if(len(links)):
-    hrefs = [link.get("href") for link in links]
-    soupFile = json.dumps(hrefs)
-    with open(f'{recetasgratis_urls_files_directory}/output-recetasgratis-{a}.json', 'w') as f:
-          f.write(soupFile)
-  else:
-    print('No links', a)
-
-
-"""# Descargar las recetas de Recetasgratis.net"""
-
-recetasgratis_urls_files_directory = '/raw/recetasgratis-urls'
-recetasgratis_html_files_directory = '/raw/recetasgratis-html'
-
-all_urls = []
-
-for file_name in os.listdir(recetasgratis_urls_files_directory):
-      with open(os.path.join(recetasgratis_urls_files_directory, file_name), 'r', encoding='utf-8') as file:
-        all_urls.extend(json.load(file))
-
-def scraper(url):
-    response = requests.get(url, headers={
-      "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    })
-    html = response.content
-    soup = BeautifulSoup(html, "html.parser")
-    find = soup.find_all("h1", class_="titulo titulo--articulo")
-    if(len(find)):
-      with open(f'{recetasgratis_html_files_directory}/{url.replace("https://www.recetasgratis.net/","")}.html', 'wb') as f:
-          f.write(html)
-
-      return True
-    else:
-      print('No recipe', url)
-      return False
-
-for url in all_urls:
-  if url not in already_scrapped:
-    result = scraper(url)
-
-    if(result):
-      already_scrapped.append(url)
-    else:
-      break
-
-"""# Extraer URLs de Saborargento.com.ar"""
-
-recetasgratis_urls_files_directory = '/raw/saborargento-urls'
-
-response = requests.get(f"https://saborargento.com.ar/", headers={
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-})
-soup = BeautifulSoup(response.content, "html.parser")
-links = soup.find_all("a", class_="post-item post-grid-item vertical")
-
-if(len(links)):
-  hrefs = [link.get("href") for link in links]
-  soupFile = json.dumps(hrefs)
-  with open(f'{recetasgratis_urls_files_directory}/output-saborargento.json', 'w') as f:
-        f.write(soupFile)
-else:
-  print('No links', a)
-
-"""# Descargar las recetas de Saborargento.com.ar"""
-
-saborargento_urls_files_directory = '/raw/saborargento-urls'
-saborargento_html_files_directory = '/raw/saborargento-html'
-
-all_urls = []
-
-for file_name in os.listdir(saborargento_urls_files_directory):
-      with open(os.path.join(saborargento_urls_files_directory, file_name), 'r', encoding='utf-8') as file:
-        all_urls.extend(json.load(file))
-
-def scraper(url):
-    response = requests.get(url, headers={
-      "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    })
-    html = response.content
-    soup = BeautifulSoup(html, "html.parser")
-    find = soup.find_all("h2", class_="wp-block-heading js-toc-item")
-    if(len(find)):
-      with open(f'{saborargento_html_files_directory}/{url.replace("https://saborargento.com.ar/","").replace("/", "|")}.html', 'wb') as f:
-          f.write(html)
-
-      return True
-    else:
-      print('No recipe', url)
-      return False
-
-def start():
-  for url in all_urls:
-    if url not in already_scrapped:
-      result = scraper(url)
-
-      if(result):
-        already_scrapped.append(url)
+    print('No links', site.name, page)
+    return []
+
+# Request headers that let the server answer 304 if the page did not change since it was saved
+def conditional_headers(url):
+  validators = frontier.validators(url)
+  headers = {}
+  if validators.etag:
+    headers['If-None-Match'] = validators.etag
+  if validators.last_modified:
+    headers['If-Modified-Since'] = validators.last_modified
+  return headers
+
+# Save a recipe page into its site's pack if the site's validator accepts it.
+# Pages the server reports as not modified, or whose content hash matches the saved copy, are not rewritten.
+# When extraction at fetch time is on, the tree parsed for the check is also run through the site's extractor; a page
+# whose extraction fails is still saved, only without its record (the cleaning stage extracts it from the pack).
+# The parsing runs in the crawler's parsing processes, so the other downloads go on meanwhile.
+async def save_recipe(crawler, site, page, url):
+  if page.status == 304:
+    frontier.mark(url, DONE, page.status, 'not modified')
+    return True
+
+  html = page.body
+  name = site.file_name(url)
+  content_hash = hashlib.sha256(html).hexdigest()
+  pack = packs[site.name]
+
+  if pack.content_hash(name) == content_hash:
+    frontier.mark_saved(url, page.status, 'unchanged', page.headers.get('ETag'), page.headers.get('Last-Modified'), content_hash)
+    return True
+
+  records_file = records_files.get(site.name)
+  is_recipe, recipe, error = False, None, None
+  if may_be_recipe(site, html):
+    is_recipe, recipe, error = await crawler.run_blocking(check_recipe_page, site.name, html, name, records_file is not None)
+  if is_recipe:
+    # The raw page is kept whatever happens to its record, so it can be extracted again later
+    pack.write(name, html)
+    if records_file:
+      if error is None:
+        append_record(records_file, name, content_hash, recipe, records_version)
       else:
-        break
+        print('Could not extract', url, error)
+
+    frontier.mark_saved(url, page.status, 'saved', page.headers.get('ETag'), page.headers.get('Last-Modified'), content_hash)
+    return True
+  else:
+    print('No recipe', url)
+    frontier.mark(url, FAILED, page.status, 'no recipe')
+    return False
+
+# Record a recipe url and queue it if it was not known yet
+def discover(crawler, site, url):
+  if frontier.add(site.name, url) and fetch_discovered:
+    crawler.enqueue(site.fetch_url(url), recipe_handler, site, url)
+
+"""# Extraer urls de recetas de un listado"""
+
+async def listing_handler(crawler, fetch_url, page, site, number):
+  hrefs = await crawler.run_blocking(listing_links, site.name, page.body)
+  for href in save_links(site, hrefs, number):
+    discover(crawler, site, site.canonical_url(href))
+
+"""# Extraer urls de recetas de los sitemaps"""
+
+# Queue the sitemaps listed in robots.txt, or the site's default sitemaps if there are none
+def robots_handler(crawler, fetch_url, page, site):
+  lines = page.body.decode('utf-8', 'replace').splitlines() if page.status == 200 else []
+  sitemaps = [line.split(':', 1)[1].strip() for line in lines if line.lower().startswith('sitemap:')]
+  if not sitemaps:
+    sitemaps = [site.site_url + path for path in site.sitemap_paths]
+  for sitemap in sitemaps:
+    crawler.enqueue(site.fetch_url(sitemap), sitemap_handler, site, stream=SitemapParser)
+
+# Follow the sitemaps of a sitemap index and queue the recipe urls of a sitemap
+def sitemap_handler(crawler, fetch_url, page, site):
+  if page.status != 200:
+    print('No sitemap', fetch_url, page.status)
+    return
+  for kind, url in page.body:
+    if kind == 'sitemap':
+      crawler.enqueue(site.fetch_url(url), sitemap_handler, site, stream=SitemapParser)
+    elif site.is_recipe_url(url):
+      discover(crawler, site, url)
+
+"""# Descargar una receta"""
+
+async def recipe_handler(crawler, fetch_url, page, site, url):
+  try:
+    await save_recipe(crawler, site, page, url)
+  except Exception as e:
+    # Settle the url so it is not handed out again forever
+    print('Could not save', url, repr(e))
+    frontier.mark(url, FAILED, page.status, repr(e))
+
+# Record a recipe url that could not be downloaded after every retry in the frontier's dead letter list
+def dead_handler(fetch_url, reason, handler, site, url):
+  if handler is recipe_handler:
+    frontier.mark(url, DEAD, None, reason)
+
+# Open the frontier, importing the urls scrapped before the frontier existed on first use
+def open_frontier():
+  frontier_file = os.path.join(raw_directory, 'frontier.sqlite3')
+  is_new = not os.path.exists(frontier_file)
+  opened = Frontier(frontier_file)
+  already_scrapped_file = os.path.join(raw_directory, 'cookpad-urls', 'output-already-scrapped-cookpad.json')
+  if is_new and os.path.exists(already_scrapped_file):
+    with open(already_scrapped_file, 'r', encoding='utf-8') as file:
+      for href in json.load(file):
+        opened.add('cookpad', f'https://cookpad.com{href}', DONE)
+  return opened
+
+# Open the frontier and the packs, locking the packs on every write when several processes share them
+def open_stores(extract, shared=False):
+  global frontier, records_version
+  frontier = open_frontier()
+  if extract:
+    # The records are extracted from whole html.parser trees
+    records_version = extraction_version(DEFAULT_PARSER, False)
+  for site in SITES.values():
+    packs[site.name] = Pack(os.path.join(raw_directory, f'{site.name}-html.pack'), shared)
+    if extract:
+      records_files[site.name] = os.path.join(raw_directory, f'{site.name}-recipes.jsonl')
+
+def close_stores():
+  frontier.close()
+  for pack in packs.values():
+    pack.close()
+
+def run_crawler(crawler, metrics_file, feeder=None):
+  try:
+    with ProcessPoolExecutor(parse_workers) if parse_workers else nullcontext() as executor:
+      crawler.executor = executor
+      asyncio.run(crawler.run(feeder))
+    if crawler.dead_letters:
+      print(len(crawler.dead_letters), 'urls could not be downloaded')
+  finally:
+    crawler.metrics.write_summary(metrics_file)
+    summary = crawler.metrics.summary()
+    print(summary["requests"], 'requests,', summary["bytes"], 'bytes in', round(summary["elapsed_seconds"], 1), 'seconds, summary in', metrics_file)
+
+# Queue the listing pages (and/or the sitemaps) of every registered site; recipe pages are queued as they are discovered.
+# Urls left pending by an interrupted crawl are queued again first. In recrawl mode the urls
+# already saved are queued too, as conditional requests against the validators of the saved copy.
+# With extract, every saved page also gets its recipe record appended to the site's records file.
+# With workers, this process only runs the discovery and the recipe pages are downloaded by that many worker processes.
+def start(concurrency=16, per_host_concurrency=4, per_host_delay=0.25, recrawl=False, extract=False, max_attempts=5, discovery='listing',
+          workers=0, lease_seconds=60):
+  global fetch_discovered
+  fetch_discovered = not workers
+  open_stores(extract)
+
+  crawler = Crawler(concurrency, per_host_concurrency, per_host_delay, max_attempts=max_attempts, on_dead=dead_handler)
+
+  if workers:
+    if recrawl:
+      frontier.requeue(DONE)
+  else:
+    states = [PENDING, DONE] if recrawl else [PENDING]
+    for state in states:
+      for site in SITES.values():
+        for url in frontier.urls(site.name, state):
+          crawler.enqueue(site.fetch_url(url), recipe_handler, site, url, headers=conditional_headers(url))
+
+  for site in SITES.values():
+    if discovery in ('listing', 'both'):
+      for number, path in site.listing_pages():
+        crawler.enqueue(f"{site.base_url}{path}", listing_handler, site, number)
+    if discovery in ('sitemap', 'both'):
+      crawler.enqueue(f"{site.base_url}/robots.txt", robots_handler, site)
+
+  try:
+    run_crawler(crawler, os.path.join(raw_directory, 'crawl-metrics.json'))
+  finally:
+    close_stores()
+
+  if workers:
+    spawn_workers(workers, concurrency, per_host_concurrency, per_host_delay, extract, max_attempts, lease_seconds)
+
+"""# Crawl distribuido"""
+
+# Keep the crawler fed with urls leased from the shared frontier and renew the leases of the urls in progress,
+# until there are no pending urls left in any worker
+async def lease_feeder(crawler, worker_id, lease_seconds):
+  last_heartbeat = time.time()
+  while True:
+    if crawler.queue.qsize() < crawler.concurrency:
+      leased = frontier.lease(worker_id, crawler.concurrency * 2, lease_seconds)
+      for source, url in leased:
+        site = SITES[source]
+        fetch_url = site.fetch_url(url)
+        # A url whose lease expired can be handed back to this same worker
+        crawler.seen.discard(fetch_url)
+        crawler.enqueue(fetch_url, recipe_handler, site, url, headers=conditional_headers(url))
+      if not leased and frontier.pending_count() == 0:
+        return
+    if time.time() - last_heartbeat > lease_seconds / 3:
+      frontier.heartbeat(worker_id, lease_seconds)
+      last_heartbeat = time.time()
+    await asyncio.sleep(0.5)
+
+# Download the urls leased from the shared frontier until none is left. Workers are processes on the machine holding
+# the raw directory (the frontier's SQLite WAL and the packs' flock locks need a local filesystem, not a network
+# share); the requests to each host are spaced out across all of them by the frontier.
+def start_worker(worker_id, concurrency=16, per_host_concurrency=4, per_host_delay=0.25, extract=False, max_attempts=5, lease_seconds=60):
+  open_stores(extract, shared=True)
+  crawler = Crawler(concurrency, per_host_concurrency, per_host_delay, max_attempts=max_attempts, on_dead=dead_handler,
+                    reserve_slot=frontier.reserve_slot)
+
+  async def feeder(crawler):
+    await lease_feeder(crawler, worker_id, lease_seconds)
+
+  try:
+    run_crawler(crawler, os.path.join(raw_directory, f'crawl-metrics-{worker_id}.json'), feeder)
+  finally:
+    close_stores()
+
+# Run worker processes of this script on this machine and wait for them to finish
+def spawn_workers(workers, concurrency, per_host_concurrency, per_host_delay, extract, max_attempts, lease_seconds):
+  arguments = [sys.executable, os.path.abspath(__file__), '--worker', '--raw-directory', raw_directory,
+               '--concurrency', str(concurrency), '--per-host', str(per_host_concurrency), '--delay', str(per_host_delay),
+               '--max-attempts', str(max_attempts), '--lease-seconds', str(lease_seconds), '--parse-workers', str(parse_workers)]
+  if extract:
+    arguments.append('--extract')
+  if base_url:
+    arguments += ['--base-url', base_url]
+
+  processes = [subprocess.Popen(arguments + ['--worker-id', f'{socket.gethostname()}-{os.getpid()}-{i}']) for i in range(workers)]
+  for process in processes:
+    process.wait()
 
 if __name__ == "__main__":
-  start()
\ No newline at end of file
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--concurrency', type=int, default=16, help='Maximum number of requests in flight')
+  parser.add_argument('--per-host', type=int, default=4, help='Maximum number of requests in flight per host')
+  parser.add_argument('--delay', type=float, default=0.25, help='Minimum seconds between requests to the same host')
+  parser.add_argument('--recrawl', action='store_true', help='Refresh the pages already saved using conditional requests')
+  parser.add_argument('--extract', action='store_true', help='Extract the recipe record of every saved page at fetch time')
+  parser.add_argument('--max-attempts', type=int, default=5, help='Attempts per url before it goes to the dead letter list')
+  parser.add_argument('--discovery', choices=['listing', 'sitemap', 'both'], default='listing', help='Find recipes from the search listings, the sitemaps or both')
+  parser.add_argument('--base-url', help='Send every request to this server instead of the real sites, e.g. the replay server')
+  parser.add_argument('--raw-directory', default=raw_directory, help='Directory of the frontier, packs and url files')
+  parser.add_argument('--workers', type=int, default=0, help='Download the recipe pages with this many worker processes')
+  parser.add_argument('--worker', action='store_true', help='Join a running crawl as a worker, downloading the urls leased from the frontier')
+  parser.add_argument('--parse-workers', type=int, default=parse_workers, help='Processes parsing the fetched pages off the event loop (0 parses them on it)')
+  parser.add_argument('--worker-id', default=f'{socket.gethostname()}-{os.getpid()}', help='Name of this worker in the frontier leases')
+  parser.add_argument('--lease-seconds', type=int, default=60, help='Seconds a leased url stays reserved to a worker that stopped sending heartbeats')
+  args = parser.parse_args()
+  raw_directory = args.raw_directory
+  parse_workers = args.parse_workers
+  if args.base_url:
+    base_url = args.base_url.rstrip("/")
+    for site in SITES.values():
+      site.base_url = f'{base_url}/{site.name}'
+  if args.worker:
+    start_worker(args.worker_id, args.concurrency, args.per_host, args.delay, args.extract, args.max_attempts, args.lease_seconds)
+  else:
+    start(args.concurrency, args.per_host, args.delay, args.recrawl, args.extract, args.max_attempts, args.discovery, args.workers, args.lease_seconds)
@@ -1,203 +1,184 @@
 # Import necessary libraries and modules
-from bs4 import BeautifulSoup  # For parsing HTML
 import os  # For interacting with the file system
+import argparse  # For the command line options
 import json  # For working with JSON data
-import re  # For regular expressions
-from unidecode import unidecode  # For converting Unicode characters to ASCII
-from common.replacements import replacements  # Custom replacements for text cleaning
-
-# Function to load HTML files from a directory and parse them using BeautifulSoup
-def load_html_files(html_files_directory):
-  soups = []
-  # Iterate through each file in the directory
-  for file_name in os.listdir(html_files_directory):
-    # Open the file and parse its contents using BeautifulSoup
-    with open(os.path.join(html_files_directory, file_name), 'r', encoding='utf-8') as file:
-      soups.append((BeautifulSoup(file.read(), "html.parser"), file_name))
-
-  return soups
-
-# Function to apply text transformations to ingredient text
-def apply_transformations(text):
-  word_array = ['unidades', 'unidad', 'lonchas', 'loncha', 'onzas', 'piezas', 'onza', 'pieza', 'gramos', 'vasos', 'vaso', 'mililitros', 'kilogramos', 'kilogramo', 's', 'g', 'g.', 'gr', 'gr.', 'cc', 'cucharadas', 'cucharadita', 'cucharada' 'taza', 'tazas', 'ml', 'kg', 'kgr', 'litro', 'porciones', 'de', 'cc.', 'cda', 'cdas', 'cdas.', 'cdita', 'cdtas..']
-
-  # Remove content between parentheses, including the parentheses themselves
-  text = re.sub( r'\([^)]*\)', '', text)
-
-  # Remove quantity of each ingredient using regular expression
-  text = re.sub(r"^\d+\s*("+'|'.join(word_array)+")?\s*", '', text)
-
-  # Remove numbers
-  text = re.sub(r'\d+', '', text)
-
-  # Remove text after "o"
-  pos_separador = text.find(" o ")
-  if pos_separador != -1:
-    text = text[:pos_separador]
-
-  # Remove text after "/"
-  pos_separador = text.find(" / ")
-  if pos_separador != -1:
-    text = text[:pos_separador]
-
-  # Apply custom replacements defined in the replacements module
-  for replacement in replacements:
-    text = text.replace(replacement[0], replacement[1])
-
-  text = text.strip()
-
-  # Remove the first word if it's in the word_array
-  words_in_string = text.split()
-  if words_in_string and words_in_string[0] in word_array:
-      text = ' '.join(words_in_string[1:])
-
-  # Remove common suffixes
-  suffixes = [" s ", " s, ", ", ", " s", " s,", " s, en", ",", ",  "]
-  for suffix in suffixes:
-    if text.endswith(suffix):
-      text = text[:-len(suffix)]
-
-  return text
-
-# Function to remove certain words from an ingredient text
-def remove_entire(ing):
-  entire_string = ["y", "de", ",", "s", "en s", 'en rusa', "en", "des", "bon", "ados", "ado", "adas", "aceit", "gr", "cc", "cdas"]
-  for ent in entire_string:
-    if ing == ent:
-      ing = ''
-
-  prefixes = ["de "]
-  for prefix in prefixes:
-    if ing.startswith(prefix):
-      ing = ing[len(prefix):]
-
-  return ing.strip()
-
-# Function to format the title of a recipe
-def format_title(title):
-  title = str(title.text)
-  title_stripped = title.strip()
-  # Remove non-ASCII characters
-  title_cleaned = re.sub(r'[^\x00-\x7F]+', '', title_stripped)
-  return title_cleaned
-
-# Function to format recipes from Cookpad website
-def format_cookpad(soups):
-  formatted_recipes = []
-
-  for soup, file_name in soups:
-    ingredients = []
-    title = format_title(soup.find('h1', itemprop='name'))
-    recipeIngredients = soup.find_all('div', itemprop='recipeIngredient')
-    steps = soup.find('div', id='steps')
-
-    for recipeIngredient in recipeIngredients:
-      # Extract and clean ingredient text
-      ingredient_text = unidecode(recipeIngredient.contents[2].strip().lower())
-      ingredient_text = apply_transformations(ingredient_text).strip()
-
-      if(ingredient_text):
-        ing_text_split = ingredient_text.split(', ')
-        for ing in ing_text_split:
-          ing = remove_entire(ing)
-          if ing and ing not in ingredients:
-            ingredients.append(ing)
-
-    formatted_recipes.append({ "title": title, "ingredients": ingredients, "url": 'https://cookpad.com/ar/recetas/' + file_name.replace('.html', '') })
-
-  return formatted_recipes
-
-# Function to format recipes from Recetas Gratis website
-def format_recetasgratis(soups):
-  formatted_recipes = []
-
-  for soup, file_name in soups:
-    ingredients = []
-    title = format_title(soup.find('h1', class_='titulo titulo--articulo'))
-    recipeIngredients = soup.find_all('li', class_='ingrediente')
-    recipeIngredients = [li for li in recipeIngredients if 'titulo' not in li.get('class')]
-
-    for recipeIngredient in recipeIngredients:
-
-      label = recipeIngredient.find('label')
-      if label:
-          label = label.text
-          lines = [line.strip() for line in label.strip().split('\n') if line.strip()]
-          label = lines[0] if lines else None
-          if label:
-            ingredient_text = unidecode(label.strip().lower())
-            ingredient_text = apply_transformations(ingredient_text)
-
-            if(ingredient_text):
-              ing_text_split = ingredient_text.split(', ')
-              for ing in ing_text_split:
-                ing = remove_entire(ing)
-                if ing and ing not in ingredients:
-                  ingredients.append(ing)
-
-
-    formatted_recipes.append({ "title": title, "ingredients": ingredients, "url": 'https://www.recetasgratis.net/' + file_name.replace('.html', '') })
-
-  return formatted_recipes
-
-# Function to format recipes from Sabor Argento website
-def format_saborargento(soups):
-  formatted_recipes = []
-
-  for soup, file_name in soups:
-    ingredients = []
-    title = format_title(soup.find('h1'))
-
-    # Find the starting <h3> tag
-    start_tag = soup.find('h3', id="✍-ingredientes-de-del-nombre-de-receta")
-
-    # Find the ending <h3> tag
-    end_tag = soup.find('h3', id="🥘-como-hacer-nombre-de-receta")
-
-    # Extract all <li> tags between these two
-    items = []
-    for tag in start_tag.find_next_siblings():
-        if tag == end_tag:
-            break
-        if tag.name == 'ul':
-            items.extend(tag.find_all('li'))
-
-    # Extract the text from each <li> tag
-    items_text = [item.text for item in items]
-
-    for item in items_text:
-      ingredient_text = unidecode(item.strip().lower())
-      ingredient_text = apply_transformations(ingredient_text).strip()
-
-      if(ingredient_text):
-        ing_text_split = ingredient_text.split(', ')
-        for ing in ing_text_split:
-          ing = remove_entire(ing)
-          if ing and ing not in ingredients:
-            ingredients.append(ing)
-
-    formatted_recipes.append({ "title": title, "ingredients": ingredients, "url": 'https://saborargento.com.ar/' + file_name.replace('.html', '') })
-
-  return formatted_recipes
-
-# Main function to start the process
-def start():
-  directories = [
-      ("/raw/cookpad-html", format_cookpad),
-      ("/raw/recetasgratis-html", format_recetasgratis),
-      ("/raw/saborargento-html", format_saborargento)
-  ]
-
-  all_formatted_recipes = []
-  # Iterate over directories and corresponding formatting functions
-  for dir, func in directories:
-      soups = load_html_files(dir)
-      all_formatted_recipes.extend(func(soups))
+import multiprocessing  # For parsing pages in parallel
+import multiprocessing.util  # For closing the packs of a pool worker when it exits
+import hashlib  # For the content hash of the loose HTML files
+from collections import Counter  # For counting the parsed and reused pages
+from common.pack import decode_html, iter_pages, open_pack, read_page, site_pack  # Packed storage of the raw HTML pages
+from common.parsing import DEFAULT_PARSER, available_parsers, parse, extraction_version as parsing_version  # Parser backends for the raw pages
+from common.extractors import normalizer  # Memoized normalization of ingredient lines
+from common.matrix import read_recipes, write_artifacts, write_json_array  # Ingredient vocabulary and recipe x ingredient matrix, and the JSON files
+from common.records import load_records  # Recipe records extracted at fetch time
+from common.sites import SITES  # Registered recipe sites and their extractors
+
+raw_directory = '/raw'
+output_file = '/formatted/formatted-recipes.json'
+# Whether to keep the normalized ingredient lines between runs, and the file they are kept in: the one given, or
+# else one named after the output file like its manifest, so runs writing different outputs do not share it
+normalizer_cache = True
+normalizer_cache_file = None
+# Parser backend, and whether to build only the parts of each page its site's extractor reads
+backend = DEFAULT_PARSER
+strain = False
+
+# Version of everything that shapes a recipe, with this run's parsing
+def extraction_version():
+  return parsing_version(backend, strain)
+
+# Function to load the manifest of the previous run: the content hash and recipe of every page, keyed by
+# "site/file name". A manifest written by another version of the extraction is discarded.
+def load_manifest(manifest_file):
+  manifest = {}
+  if not os.path.exists(manifest_file):
+    return manifest
+  with open(manifest_file, 'r', encoding='utf-8') as file:
+    header = json.loads(file.readline() or '{}')
+    if header.get("version") != extraction_version():
+      return manifest
+    for line in file:
+      entry = json.loads(line)
+      manifest[entry["page"]] = entry
+  return manifest
+
+# The stage is a pipeline of generators: page_tasks lists the pages, extract_page reads, parses and extracts each one
+# and write_lines writes its recipe out before the next one is read, so only one HTML tree is in memory at a time
+# whatever the size of the corpus.
+
+# Function to list a site's pages as (site name, HTML directory, file name, content hash, recipe) tasks:
+# the pages of its pack, if it has one, and then the loose HTML files not in it.
+# The recipe is the one of the previous run (from the manifest) or the one extracted by the scraper (with from_records)
+# when either was made from the page's current content, None otherwise.
+def page_tasks(site, html_files_directory, from_records=False, manifest=None, counts=None):
+  records = load_records(html_files_directory[:-len('-html')] + '-recipes.jsonl') if from_records else {}
+  version = extraction_version()
+  with site_pack(html_files_directory) as pack:
+    for file_name, in_pack in iter_pages(html_files_directory, pack):
+      content_hash = pack.content_hash(file_name) if in_pack else file_hash(os.path.join(html_files_directory, file_name))
+      recipe = None
+      record = records.get(file_name)
+      # The manifest was checked against the extraction version as a whole, each record carries its own
+      for known in ((manifest or {}).get(f'{site.name}/{file_name}'), record if record and record.get("version") == version else None):
+        if known and known["content_hash"] == content_hash:
+          recipe = known["recipe"]
+          break
+      if counts is not None:
+        counts["reused" if recipe is not None else "parsed"] += 1
+      yield site.name, html_files_directory, file_name, content_hash, recipe
+
+def file_hash(path):
+  with open(path, 'rb') as file:
+    return hashlib.sha256(file.read()).hexdigest()
+
+# Packs opened by extract_page (None for a site without one), kept open across its tasks until close_worker_packs
+worker_packs = {}
+
+def close_worker_packs():
+  for pack in worker_packs.values():
+    if pack is not None:
+      pack.close()
+  worker_packs.clear()
+
+# Function to parse one page, or reuse its known recipe, returning (site name, file name, content hash, recipe).
+# Run by the pool workers in parallel mode, so it only returns the small recipe dict.
+def extract_page(task):
+  site_name, html_files_directory, file_name, content_hash, recipe = task
+  if recipe is None:
+    if html_files_directory not in worker_packs:
+      worker_packs[html_files_directory] = open_pack(html_files_directory)
+    # Decoded like open(..., 'r', encoding='utf-8') reads a loose file, whichever place the page comes from
+    html = decode_html(read_page(html_files_directory, file_name, worker_packs[html_files_directory]))
+    site = SITES[site_name]
+    recipe = site.extract(parse(html, site, backend, strain), file_name)
+  return site_name, file_name, content_hash, recipe
+
+# Function to format the recipes of every site, one at a time, in this process or with a pool of worker processes.
+# The pool yields the recipes in task order, so the output is the same as the serial one.
+def format_all(from_records=False, workers=0, manifest=None, counts=None):
+  tasks = (task for site in SITES.values() for task in page_tasks(site, os.path.join(raw_directory, f"{site.name}-html"), from_records, manifest, counts))
+  if not workers:
+    try:
+      yield from map(extract_page, tasks)
+    finally:
+      close_worker_packs()
+    return
+  with multiprocessing.Pool(workers, initializer=start_worker, initargs=(backend, strain)) as pool:
+    yield from pool.imap(extract_page, tasks, chunksize=8)
+    # Let the workers exit on their own, closing their packs, instead of being terminated
+    pool.close()
+    pool.join()
+
+# Function to choose the parsing in a pool worker, which may not inherit this module's globals
+def set_parsing(parser_backend, strain_pages):
+  global backend, strain
+  backend = parser_backend
+  strain = strain_pages
+
+# Function to set up a pool worker: its parsing, and its packs closed when it exits
+def start_worker(parser_backend, strain_pages):
+  set_parsing(parser_backend, strain_pages)
+  multiprocessing.util.Finalize(None, close_worker_packs, exitpriority=10)
+
+# Function to append each recipe to a JSON lines file as soon as it is formatted, and its page to the new manifest
+def write_lines(pages, lines_file, manifest_file):
+  with open(lines_file, 'w') as f, open(manifest_file + '.tmp', 'w', encoding='utf-8') as manifest:
+    manifest.write(json.dumps({ "version": extraction_version() }) + '\n')
+    for site_name, file_name, content_hash, recipe in pages:
+      f.write(json.dumps(recipe) + '\n')
+      manifest.write(json.dumps({ "page": f'{site_name}/{file_name}', "content_hash": content_hash, "recipe": recipe }) + '\n')
+  os.replace(manifest_file + '.tmp', manifest_file)
+
+# Function to compact the JSON lines file into the JSON array read by the next stages, one recipe at a time.
+# The result is byte for byte what json.dump(recipes, f, indent=4) writes.
+def compact(lines_file, json_file):
+  write_json_array(read_recipes(lines_file), json_file)
+
+# Main function to start the process. Pages whose content and extraction did not change since the previous run
+# are taken from its manifest instead of being parsed again, unless full is set. The pool workers start from the
+# saved normalizer cache, but only a serial run adds the lines it normalized to it.
+def start(from_records=False, workers=0, compact_output=True, full=False):
+  base_name = os.path.splitext(output_file)[0]
+  manifest_file = base_name + '-manifest.jsonl'
+  cache_file = (normalizer_cache_file or base_name + '-normalizer-cache.json') if normalizer_cache else None
+  if cache_file:
+    normalizer.load(cache_file)
+
+  manifest = {} if full else load_manifest(manifest_file)
+  counts = Counter()
+  write_lines(format_all(from_records, workers, manifest, counts), base_name + '.jsonl', manifest_file)
+  print(f'{counts["parsed"]} pages parsed, {counts["reused"]} unchanged')
+
+  if cache_file and not workers:
+    normalizer.save(cache_file)
+    stats = normalizer.stats()
+    print(f'Normalizer cache: {stats["hits"]} hits, {stats["misses"]} misses ({stats["hit_rate"]:.1%}), {stats["size"]} lines saved')
+
+  # Write the ingredient vocabulary and the recipe x ingredient matrix for the later stages
+  output_directory = os.path.dirname(output_file)
+  write_artifacts(base_name + '.jsonl', os.path.join(output_directory, 'ingredient-vocabulary.json'), os.path.join(output_directory, 'recipe-ingredients.npz'))
 
   # Write the formatted recipes to a JSON file
-  with open('/formatted/formatted-recipes.json', 'w') as f:
-      json.dump(all_formatted_recipes, f, indent=4)
+  if compact_output:
+    compact(base_name + '.jsonl', output_file)
 
 # Entry point of the script
 if __name__ == "__main__":
-  start()
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--from-records', action='store_true', help='Reuse the recipe records extracted by the scraper instead of parsing their pages again')
+  parser.add_argument('--workers', type=int, default=0, help='Parse the pages with this many processes (0 parses them in this one)')
+  parser.add_argument('--raw-directory', default=raw_directory, help='Directory of the raw pages')
+  parser.add_argument('--output', default=output_file, help='Formatted recipes file to write, next to its JSON lines version')
+  parser.add_argument('--normalizer-cache', default=normalizer_cache_file, help='File keeping the normalized ingredient lines between runs (default: next to the output, named after it)')
+  parser.add_argument('--no-normalizer-cache', action='store_true', help='Normalize every line from scratch without saving the cache')
+  parser.add_argument('--full', action='store_true', help='Parse every page again instead of reusing the unchanged ones from the previous run')
+  parser.add_argument('--parser', choices=available_parsers(), default=backend, help='Parser backend for the raw pages')
+  parser.add_argument('--strain', action='store_true', help="Only build the parts of each page its site's extractor reads")
+  parser.add_argument('--no-compact', action='store_true', help='Only write the JSON lines file, without the JSON array read by the next stages')
+  args = parser.parse_args()
+  raw_directory = args.raw_directory
+  output_file = args.output
+  normalizer_cache = not args.no_normalizer_cache
+  normalizer_cache_file = args.normalizer_cache
+  set_parsing(args.parser, args.strain)
+  start(args.from_records, args.workers, not args.no_compact, args.full)
@@ -1,32 +1,89 @@
+import argparse
 import json
+import os
+from common.cooccurrence import count_pairs_serial, count_pairs_sharded, count_pairs_sparse, count_pairs_streaming, top_pairs_sketch
+from common.matrix import build_matrix, load_matrix, load_vocabulary, read_json_array, read_recipes, write_json_array
 
-def start():
-    recipes = None
-    with open('/formatted/formatted-recipes.json', 'r', encoding='utf-8') as file:
-        recipes = json.loads(file.read())
-
-    # Initialize a dictionary to count ingredient pairs
-    ingredient_pairs = {}
-
-    # Iterate through each recipe
-    for recipe in recipes:
-        # Get all unique pairs of ingredients in each recipe
-        ingredients = recipe["ingredients"]
-        for i in range(len(ingredients)):
-            for j in range(i + 1, len(ingredients)):
-                # Sort the pair to ensure consistency (alphabetical order)
-                pair = tuple(sorted([ingredients[i], ingredients[j]]))
-                # Increment the count for this pair in the dictionary
-                if pair in ingredient_pairs:
-                    ingredient_pairs[pair] += 1
-                else:
-                    ingredient_pairs[pair] = 1
-
-    # Convert the dictionary to the desired list format
-    ingredient_pairs_list = [{"ing1": pair[0], "ing2": pair[1], "count": count} for pair, count in ingredient_pairs.items()]
-
-    with open('/formatted/ingredient-pairs.json', 'w') as f:
-        json.dump(ingredient_pairs_list, f, indent=4)
+formatted_directory = '/formatted'
+spill_directory = None
+
+# The recipe x ingredient matrix written by the cleaning stage, or built from the recipes if there is none
+def load_recipe_matrix():
+    vocabulary_file = os.path.join(formatted_directory, 'ingredient-vocabulary.json')
+    matrix_file = os.path.join(formatted_directory, 'recipe-ingredients.npz')
+    if os.path.exists(vocabulary_file) and os.path.exists(matrix_file):
+        names, _ = load_vocabulary(vocabulary_file)
+        indptr, indices, _ = load_matrix(matrix_file)
+        return names, indptr, indices
+    return build_matrix(load_recipes())
+
+def load_recipes():
+    with open(os.path.join(formatted_directory, 'formatted-recipes.json'), 'r', encoding='utf-8') as file:
+        return json.loads(file.read())
+
+# The file stream_recipes reads: the JSON lines file of the cleaning stage or else the JSON array
+def recipes_file():
+    lines_file = os.path.join(formatted_directory, 'formatted-recipes.jsonl')
+    if os.path.exists(lines_file):
+        return lines_file
+    return os.path.join(formatted_directory, 'formatted-recipes.json')
+
+# The recipes one at a time, from the JSON lines file of the cleaning stage or else from the JSON array
+def stream_recipes():
+    source = recipes_file()
+    if source.endswith('.jsonl'):
+        return read_recipes(source)
+    return read_json_array(source)
+
+# Count the pairs of ingredients used together in recipes, as (ing1, ing2, count) in order of first appearance.
+# The sparse engine counts them with a sparse matrix product; sharded counts shards of the recipes in parallel
+# with a pool of worker processes and merges their tables; streaming reads the recipes one at a time and spills
+# partial counts to disk to stay within memory_budget bytes; serial is the original loop over every pair.
+def ingredient_pairs(engine='sparse', workers=0, memory_budget=256 << 20):
+    if engine == 'streaming':
+        # About 128 bytes per buffered pair: its key, the pair ids and sort indices while counting, its table row
+        return count_pairs_streaming(stream_recipes(), max(memory_budget // 128, 1 << 16), spill_directory)
+    if engine == 'serial':
+        return [(pair[0], pair[1], count) for pair, count in count_pairs_serial(load_recipes()).items()]
+
+    names, indptr, indices = load_recipe_matrix()
+    if engine == 'sharded':
+        first, second, counts = count_pairs_sharded(indptr, indices, len(names), workers or os.cpu_count())
+    else:
+        first, second, counts = count_pairs_sparse(indptr, indices, len(names))
+    return [(names[i], names[j], count) for i, j, count in zip(first.tolist(), second.tolist(), counts.tolist())]
+
+# Write the pairs as a JSON list of {"ing1", "ing2", "count"} objects one at a time, byte for byte what
+# json.dump(pairs, f, indent=4) writes
+def write_pairs(pairs, pairs_file):
+    write_json_array(({"ing1": ing1, "ing2": ing2, "count": count} for ing1, ing2, count in pairs), pairs_file)
+
+def start(engine='sparse', workers=0, memory_budget=256 << 20):
+    write_pairs(ingredient_pairs(engine, workers, memory_budget), os.path.join(formatted_directory, 'ingredient-pairs.json'))
+
+# Quick preview of the heaviest pairs of a huge corpus, with counts estimated by a fixed-size sketch
+def preview(top, sketch_width, sketch_depth):
+    pairs = top_pairs_sketch(stream_recipes(), top, sketch_width, sketch_depth)
+    write_pairs(pairs, os.path.join(formatted_directory, 'ingredient-pairs-top.json'))
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', choices=['sparse', 'sharded', 'streaming', 'serial'], help='Count the pairs with a sparse matrix product (the default), in parallel shards, streaming in bounded memory or with the original loop')
+    parser.add_argument('--workers', type=int, default=0, help='Processes of the sharded engine (0 uses one per CPU); setting it selects that engine, and it cannot be combined with another one or with --top')
+    parser.add_argument('--memory-budget', type=int, default=256, help='Megabytes of pairs the streaming engine keeps in memory before spilling them to disk')
+    parser.add_argument('--spill-directory', help='Directory for the spilled counts of the streaming engine (default: the system temporary directory)')
+    parser.add_argument('--top', type=int, default=0, help='Only write the approximate top N pairs to ingredient-pairs-top.json, counted with a Count-Min sketch instead of an engine')
+    parser.add_argument('--sketch-width', type=int, default=1 << 20, help='Counters per row of the sketch (rounded down to a power of two)')
+    parser.add_argument('--sketch-depth', type=int, default=4, help='Rows of the sketch')
+    parser.add_argument('--formatted-directory', default=formatted_directory)
+    args = parser.parse_args()
+    if args.workers and args.engine not in (None, 'sharded'):
+        parser.error(f'--workers only applies to the sharded engine, not to --engine {args.engine}')
+    if args.top and (args.workers or args.engine):
+        parser.error('--top counts with the sketch, without an engine: leave out --engine and --workers')
+    formatted_directory = args.formatted_directory
+    spill_directory = args.spill_directory
+    if args.top:
+        preview(args.top, args.sketch_width, args.sketch_depth)
+    else:
+        start(args.engine or ('sharded' if args.workers else 'sparse'), args.workers, args.memory_budget << 20)
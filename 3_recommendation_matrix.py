@@ -1,20 +1,39 @@
+import argparse
+import heapq
 import json
 from collections import defaultdict
 
-def start():
-    pairings_data = None
-    with open('/formatted/ingredient-pairs.json', 'r', encoding='utf-8') as file:
-        pairings_data = json.loads(file.read())
-
-    # Convert pairings data into a more accessible structure for recommendations
+# Convert pairings data into a more accessible structure for recommendations
+def recommendation_matrix(pairings_data):
     # Create a dictionary to hold ingredient pairings and counts
     pairings = defaultdict(lambda: defaultdict(int))
     for pairing in pairings_data:
         pairings[pairing["ing1"]][pairing["ing2"]] += pairing["count"]
         pairings[pairing["ing2"]][pairing["ing1"]] += pairing["count"]
+    return pairings
+
+# Keep the k neighbours of every ingredient with the highest counts, as [neighbour, count] lists sorted by count,
+# so a recommendation reads k entries per ingredient instead of its whole row. Equal counts keep their row order.
+def top_neighbours(pairings, k):
+    return {ingredient: [[neighbour, count] for neighbour, count in heapq.nlargest(k, row.items(), key=lambda item: item[1])]
+            for ingredient, row in pairings.items()}
+
+def start(top_k=10):
+    pairings_data = None
+    with open('/formatted/ingredient-pairs.json', 'r', encoding='utf-8') as file:
+        pairings_data = json.loads(file.read())
+
+    pairings = recommendation_matrix(pairings_data)
 
     with open('/formatted/ingredient-recomendation-matrix.json', 'w') as f:
         json.dump(pairings, f, indent=4)
 
+    # Written without indentation, as the web app bundles it
+    with open('/formatted/ingredient-recomendation-top.json', 'w') as f:
+        json.dump(top_neighbours(pairings, top_k), f)
+
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top-k', type=int, default=10, help='Neighbours kept per ingredient in ingredient-recomendation-top.json')
+    args = parser.parse_args()
+    start(args.top_k)
\ No newline at end of file
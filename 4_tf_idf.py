@@ -1,11 +1,8 @@
 import json
 from math import log
 
-def start():
-    pairings_data = None
-    with open('./formatted/ingredient-pairs.json', 'r', encoding='utf-8') as file:
-        pairings_data = json.loads(file.read())
-
+# Replace the count of every pair by its tf-idf weight, with the pairings as documents
+def tf_idf(pairings_data):
     # Calculate Document Frequency (DF) for each ingredient
     ingredient_doc_freq = {}
     for pair in pairings_data:
@@ -28,6 +25,14 @@ def start():
         ing1_tf_idf = pair['count'] * ingredient_idf[pair['ing1']]
         ing2_tf_idf = pair['count'] * ingredient_idf[pair['ing2']]
         pair['count'] = ing1_tf_idf + ing2_tf_idf
+    return pairings_data
+
+def start():
+    pairings_data = None
+    with open('./formatted/ingredient-pairs.json', 'r', encoding='utf-8') as file:
+        pairings_data = json.loads(file.read())
+
+    pairings_data = tf_idf(pairings_data)
 
     with open('./formatted/ingredient-pairs-tfidf.json', 'w') as f:
         json.dump(pairings_data, f, indent=4)
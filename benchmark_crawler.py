@@ -0,0 +1,83 @@
+# Repeatable throughput benchmark of the scraper: replays the raw corpus through replay_server.py
+# and crawls it from scratch into a temporary directory, then reports the crawl metrics of every crawl process
+# (the coordinator's and, with --workers, each worker's)
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from common.sites import SITES
+
+def wait_for_server(url, timeout=30):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    try:
+      urllib.request.urlopen(url)
+      return
+    except OSError:
+      time.sleep(0.2)
+  raise RuntimeError(f'Replay server did not start at {url}')
+
+# The crawl summaries the scraper processes wrote to the raw directory, by file name: crawl-metrics.json of the
+# coordinator and crawl-metrics-<worker id>.json of each worker
+def load_summaries(raw_directory):
+  summaries = {}
+  for file_name in sorted(os.listdir(raw_directory)):
+    if file_name.startswith('crawl-metrics') and file_name.endswith('.json'):
+      with open(os.path.join(raw_directory, file_name), 'r', encoding='utf-8') as file:
+        summaries[file_name] = json.load(file)
+  return summaries
+
+def start(port=8080, latency=0.05, bandwidth=0, error_rate=0.0, seed=0, corpus_directory='/raw', scraper_args=()):
+  base_url = f'http://127.0.0.1:{port}'
+  server = subprocess.Popen([sys.executable, 'replay_server.py', '--port', str(port), '--latency', str(latency),
+                             '--bandwidth', str(bandwidth), '--error-rate', str(error_rate), '--seed', str(seed),
+                             '--raw-directory', corpus_directory])
+  try:
+    wait_for_server(f'{base_url}/{next(iter(SITES))}/robots.txt')
+    with tempfile.TemporaryDirectory() as raw_directory:
+      for site in SITES.values():
+        os.makedirs(os.path.join(raw_directory, f'{site.name}-urls'))
+
+      started = time.perf_counter()
+      subprocess.run([sys.executable, '0_scraping.py', '--base-url', base_url, '--raw-directory', raw_directory, *scraper_args], check=True)
+      wall_seconds = time.perf_counter() - started
+
+      summaries = load_summaries(raw_directory)
+      db = sqlite3.connect(os.path.join(raw_directory, 'frontier.sqlite3'))
+      states = dict(db.execute('SELECT state, COUNT(*) FROM urls GROUP BY state').fetchall())
+      db.close()
+  finally:
+    server.terminate()
+    server.wait()
+
+  # A single process crawled for its elapsed time; the workers run after the coordinator's discovery, so with several
+  # processes the throughput is over the whole run of the scraper, process start up included
+  requests = sum(summary["requests"] for summary in summaries.values())
+  size = sum(summary["bytes"] for summary in summaries.values())
+  elapsed = next(iter(summaries.values()))["elapsed_seconds"] if len(summaries) == 1 else wall_seconds
+  print(f'{requests} requests by {len(summaries)} crawl processes in {elapsed:.1f}s: {requests / elapsed:.1f} req/s, {size / elapsed / 1e6:.2f} MB/s')
+  print('Frontier:', states)
+  for file_name, summary in summaries.items():
+    for host, metrics in summary["hosts"].items():
+      total = metrics["timings"]["total"]
+      if total["count"]:
+        print(f'  {file_name} {host}: {metrics["requests"]} requests, p50 {total["p50"]:.3f}s, p90 {total["p90"]:.3f}s, {metrics["retries"]} retries')
+  return { "requests": requests, "bytes": size, "elapsed_seconds": elapsed, "processes": summaries }
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Arguments after -- are passed to 0_scraping.py, e.g. -- --concurrency 32 --delay 0')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--latency', type=float, default=0.05)
+  parser.add_argument('--bandwidth', type=int, default=0)
+  parser.add_argument('--error-rate', type=float, default=0.0)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--corpus-directory', default='/raw', help='Raw directory served by the replay server')
+  parser.add_argument('scraper_args', nargs=argparse.REMAINDER)
+  args = parser.parse_args()
+  scraper_args = args.scraper_args[1:] if args.scraper_args[:1] == ['--'] else args.scraper_args
+  start(args.port, args.latency, args.bandwidth, args.error_rate, args.seed, args.corpus_directory, scraper_args)
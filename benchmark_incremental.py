@@ -0,0 +1,71 @@
+# Benchmark of the incremental index: rounds of random recipe additions and removals applied as deltas, checking
+# after each one that the pairs, recommendation matrix and tf-idf weights equal a full recompute over the recipes left
+import argparse
+import importlib
+import json
+import os
+import random
+import tempfile
+import time
+from common.cooccurrence import count_pairs_serial
+from common.incremental import CooccurrenceIndex
+
+matrix_stage = importlib.import_module('3_recommendation_matrix')
+tf_idf_stage = importlib.import_module('4_tf_idf')
+
+# The three stages run from scratch, as the JSON they write
+def full_recompute(recipes):
+  pairs = [{"ing1": pair[0], "ing2": pair[1], "count": count} for pair, count in count_pairs_serial(recipes).items()]
+  matrix = json.dumps(matrix_stage.recommendation_matrix(pairs), indent=4)
+  serialized_pairs = json.dumps(pairs, indent=4)
+  return serialized_pairs, matrix, json.dumps(tf_idf_stage.tf_idf(pairs), indent=4)
+
+def index_outputs(index):
+  pairs = [{"ing1": ing1, "ing2": ing2, "count": count} for ing1, ing2, count in index.pairs()]
+  return json.dumps(pairs, indent=4), json.dumps(index.recommendation_matrix(), indent=4), json.dumps(index.tf_idf_pairs(), indent=4)
+
+def start(recipes_file, rounds=20, batch=5, seed=0):
+  generator = random.Random(seed)
+  with open(recipes_file, 'r', encoding='utf-8') as file:
+    recipes = json.load(file)
+  generator.shuffle(recipes)
+  # Some recipes start outside the index, to be added in the rounds
+  current = recipes[:len(recipes) * 3 // 4]
+  outside = recipes[len(recipes) * 3 // 4:]
+  index = CooccurrenceIndex.from_recipes(current)
+
+  identical = True
+  delta_seconds = full_seconds = 0
+  for _ in range(rounds):
+    removed = generator.sample(current, batch)
+    added = generator.sample(outside, batch)
+    started = time.perf_counter()
+    index.update(added, removed)
+    delta_seconds += time.perf_counter() - started
+
+    removed_urls = { recipe["url"] for recipe in removed }
+    added_urls = { recipe["url"] for recipe in added }
+    current = [recipe for recipe in current if recipe["url"] not in removed_urls] + added
+    outside = [recipe for recipe in outside if recipe["url"] not in added_urls] + removed
+    started = time.perf_counter()
+    expected = full_recompute(current)
+    full_seconds += time.perf_counter() - started
+    identical = identical and index_outputs(index) == expected
+
+  print(f'{rounds} rounds of {batch} recipes added and {batch} removed, {len(current)} recipes in the index')
+  print(f'delta updates {delta_seconds:.4f}s, full recomputes {full_seconds:.2f}s ({full_seconds / delta_seconds:.0f}x)')
+  with tempfile.TemporaryDirectory() as directory:
+    saved = os.path.join(directory, 'cooccurrence-index.json')
+    index.save(saved)
+    identical = identical and index_outputs(CooccurrenceIndex.load(saved)) == expected
+  print('pairs, matrix and tf-idf weights', 'identical' if identical else 'DIFFER', 'to the full recompute after every round and reloading')
+  return identical
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--recipes', default='/formatted/formatted-recipes.json')
+  parser.add_argument('--rounds', type=int, default=20)
+  parser.add_argument('--batch', type=int, default=5, help='Recipes added and removed in every round')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+  raise SystemExit(0 if start(args.recipes, args.rounds, args.batch, args.seed) else 1)
@@ -0,0 +1,77 @@
+# Benchmark of the ingredient pair counting engines on a synthetic corpus many times larger than the real one,
+# checking that every engine lists the same pairs, counts and order as the original loop
+import argparse
+import json
+import random
+import time
+from common.cooccurrence import count_pairs_serial, count_pairs_sharded, count_pairs_sparse, count_pairs_streaming, top_pairs_sketch
+from common.matrix import build_matrix
+
+# Recipes made from the real ones by swapping some of their ingredients for random ones of the vocabulary,
+# so the synthetic corpus has new pairs as well as the real ones
+def synthetic_recipes(recipes, scale, seed):
+  generator = random.Random(seed)
+  names = sorted({ name for recipe in recipes for name in recipe["ingredients"] })
+  result = []
+  for _ in range(scale):
+    for recipe in recipes:
+      ingredients = list(recipe["ingredients"])
+      for k in range(len(ingredients)):
+        if generator.random() < 0.3:
+          ingredients[k] = generator.choice(names)
+      result.append({ "ingredients": list(dict.fromkeys(ingredients)) })
+  return result
+
+def timed(label, function, baseline=None):
+  started = time.perf_counter()
+  result = function()
+  seconds = time.perf_counter() - started
+  print(f'{label:9} {seconds:7.2f}s' + (f' ({baseline / seconds:.1f}x)' if baseline else ''))
+  return result, seconds
+
+def start(recipes_file, scale=100, seed=0, workers=2, buffer_pairs=1 << 20, top=100):
+  with open(recipes_file, 'r', encoding='utf-8') as file:
+    recipes = synthetic_recipes(json.load(file), scale, seed)
+  names, indptr, indices = build_matrix(recipes)
+  print(f'{len(recipes)} recipes, {len(names)} ingredients, {len(indices)} recipe ingredients')
+
+  expected, serial_seconds = timed('serial', lambda: [(pair[0], pair[1], count) for pair, count in count_pairs_serial(recipes).items()])
+  print(f'{len(expected)} distinct pairs')
+
+  engines = {
+    'sparse': lambda: count_pairs_sparse(indptr, indices, len(names)),
+    'sharded': lambda: count_pairs_sharded(indptr, indices, len(names), workers),
+  }
+  identical = True
+  for label, count in engines.items():
+    def named_pairs():
+      first, second, counts = count()
+      return [(names[i], names[j], n) for i, j, n in zip(first.tolist(), second.tolist(), counts.tolist())]
+    pairs, _ = timed(label, named_pairs, serial_seconds)
+    identical = identical and pairs == expected
+    print(f'{label} output', 'identical' if pairs == expected else 'DIFFERS', 'to the serial one')
+
+  # Streaming with a buffer far smaller than the pairs, so the counts go through several spilled runs
+  pairs, _ = timed('streaming', lambda: list(count_pairs_streaming(iter(recipes), buffer_pairs)), serial_seconds)
+  identical = identical and pairs == expected
+  print(f'streaming output ({buffer_pairs} pairs buffered)', 'identical' if pairs == expected else 'DIFFERS', 'to the serial one')
+
+  # The sketch only has to find the heaviest pairs, and its estimates can only be too high
+  estimated, _ = timed('sketch', lambda: top_pairs_sketch(iter(recipes), top), serial_seconds)
+  exact = { (ing1, ing2): count for ing1, ing2, count in expected }
+  heaviest = { pair for pair, _ in sorted(exact.items(), key=lambda item: -item[1])[:top] }
+  found = len(heaviest & { (ing1, ing2) for ing1, ing2, _ in estimated })
+  overcount = max((count - exact[(ing1, ing2)] for ing1, ing2, count in estimated), default=0)
+  print(f'sketch top {top}: {found} of the exact top {top} found, estimates at most {overcount} over')
+  return identical
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--recipes', default='/formatted/formatted-recipes.json')
+  parser.add_argument('--scale', type=int, default=100, help='Synthetic recipes per real recipe')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--workers', type=int, default=2, help='Processes of the sharded engine')
+  parser.add_argument('--buffer-pairs', type=int, default=1 << 20, help='Pairs the streaming engine buffers before spilling them')
+  parser.add_argument('--top', type=int, default=100, help='Pairs the sketch is asked for')
+  args = parser.parse_args()
+  raise SystemExit(0 if start(args.recipes, args.scale, args.seed, args.workers, args.buffer_pairs, args.top) else 1)
@@ -0,0 +1,49 @@
+# Benchmark of the parser backends on the raw corpus: parses every page with each available backend, whole
+# and strained to the parts the extractors read, and checks the recipes match the html.parser whole-page ones
+import argparse
+import importlib
+import time
+from common.pack import decode_html, iter_pages, read_page, site_pack
+from common.parsing import DEFAULT_PARSER, available_parsers, parse
+from common.sites import SITES
+
+cleaning = importlib.import_module('1_cleaning_and_formatting_recipes')
+
+# The decoded pages of every site, read once so the timings only cover parsing and extraction
+def load_pages():
+  pages = []
+  for site in SITES.values():
+    html_files_directory = f'{cleaning.raw_directory}/{site.name}-html'
+    with site_pack(html_files_directory) as pack:
+      for file_name, _ in iter_pages(html_files_directory, pack):
+        pages.append((site, file_name, decode_html(read_page(html_files_directory, file_name, pack))))
+  return pages
+
+def extract_all(pages, parser, strain):
+  started = time.perf_counter()
+  recipes = [site.extract(parse(html, site, parser, strain), file_name) for site, file_name, html in pages]
+  return recipes, time.perf_counter() - started
+
+def start():
+  pages = load_pages()
+  expected, baseline_seconds = extract_all(pages, DEFAULT_PARSER, False)
+  print(f'{len(pages)} pages, backends: {", ".join(available_parsers())}')
+  print(f'{DEFAULT_PARSER:12} whole:    {baseline_seconds:6.2f}s')
+
+  identical = True
+  for parser in available_parsers():
+    for strain in (False, True):
+      if parser == DEFAULT_PARSER and not strain:
+        continue
+      recipes, seconds = extract_all(pages, parser, strain)
+      mismatches = [recipe["url"] for recipe, reference in zip(recipes, expected) if recipe != reference]
+      identical = identical and not mismatches
+      print(f'{parser:12} {"strained" if strain else "whole":9} {seconds:6.2f}s ({baseline_seconds / seconds:.1f}x), {len(mismatches)} recipes differ {mismatches[:3]}')
+  return identical
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--raw-directory', default=cleaning.raw_directory)
+  args = parser.parse_args()
+  cleaning.raw_directory = args.raw_directory
+  raise SystemExit(0 if start() else 1)
@@ -0,0 +1,67 @@
+# Equivalence check and benchmark of the replacement engine against the rule by rule str.replace loop,
+# over every ingredient line of the raw corpus as it reaches the replacements in apply_transformations
+import argparse
+import importlib
+import time
+import common.extractors as extractors
+from common.multireplace import ReplacementEngine, replace_sequentially
+from common.replacements import replacements
+from common.sites import SITES
+
+cleaning = importlib.import_module('1_cleaning_and_formatting_recipes')
+
+# Records the text handed to the replacements while the extractors run
+class RecordingEngine:
+  def __init__(self, engine):
+    self.engine = engine
+    self.lines = []
+
+  def apply(self, text):
+    self.lines.append(text)
+    return self.engine.apply(text)
+
+def collect_lines():
+  recorder = RecordingEngine(extractors.replacement_engine)
+  extractors.replacement_engine = recorder
+  # Turn the normalizer cache off so repeated lines reach the replacements every time
+  maxsize = extractors.normalizer.maxsize
+  extractors.normalizer.maxsize = 0
+  extractors.normalizer.cache.clear()
+  try:
+    for site in SITES.values():
+      for task in cleaning.page_tasks(site, f'{cleaning.raw_directory}/{site.name}-html'):
+        cleaning.extract_page(task)
+  finally:
+    extractors.replacement_engine = recorder.engine
+    extractors.normalizer.maxsize = maxsize
+  return recorder.lines
+
+def timed(function, lines):
+  started = time.perf_counter()
+  results = [function(line) for line in lines]
+  return results, time.perf_counter() - started
+
+def start(repeat=5):
+  lines = collect_lines()
+  started = time.perf_counter()
+  engine = ReplacementEngine(replacements)
+  print(f'{len(replacements)} rules compiled in {time.perf_counter() - started:.3f}s')
+
+  expected, loop_seconds = timed(lambda line: replace_sequentially(line, replacements), lines * repeat)
+  results, engine_seconds = timed(engine.apply, lines * repeat)
+  mismatches = [(line, a, b) for line, a, b in zip(lines, expected, results) if a != b]
+  for line, a, b in mismatches[:10]:
+    print(f'Mismatch for {line!r}: {a!r} != {b!r}')
+
+  print(f'{len(lines)} lines ({len(set(lines))} distinct), {len(mismatches)} mismatches')
+  print(f'str.replace loop: {loop_seconds / len(expected) * 1e6:.1f} us/line')
+  print(f'engine:           {engine_seconds / len(results) * 1e6:.1f} us/line ({loop_seconds / engine_seconds:.1f}x)')
+  return not mismatches
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--raw-directory', default=cleaning.raw_directory)
+  parser.add_argument('--repeat', type=int, default=5, help='Times each line is processed in the timing runs')
+  args = parser.parse_args()
+  cleaning.raw_directory = args.raw_directory
+  raise SystemExit(0 if start(args.repeat) else 1)
@@ -0,0 +1,136 @@
+# Check of the ingredient tokenizer against the transformation chain it replaced, over every ingredient line of the
+# raw corpus as it reaches apply_transformations, and the time per line of both, with and without the replacements table
+import argparse
+import importlib
+import re
+import statistics
+import time
+import common.extractors as extractors
+from common.extractors import tokenize
+from common.sites import SITES
+
+cleaning = importlib.import_module('1_cleaning_and_formatting_recipes')
+
+# The chain as it was before the tokenizer: four regex passes with the quantity pattern rebuilt on every call
+def transform_reference(text):
+  word_array = ['unidades', 'unidad', 'lonchas', 'loncha', 'onzas', 'piezas', 'onza', 'pieza', 'gramos', 'vasos', 'vaso', 'mililitros', 'kilogramos', 'kilogramo', 's', 'g', 'g.', 'gr', 'gr.', 'cc', 'cucharadas', 'cucharadita', 'cucharada' 'taza', 'tazas', 'ml', 'kg', 'kgr', 'litro', 'porciones', 'de', 'cc.', 'cda', 'cdas', 'cdas.', 'cdita', 'cdtas..']
+  text = re.sub( r'\([^)]*\)', '', text)
+  text = re.sub(r"^\d+\s*("+'|'.join(word_array)+")?\s*", '', text)
+  text = re.sub(r'\d+', '', text)
+  pos_separador = text.find(" o ")
+  if pos_separador != -1:
+    text = text[:pos_separador]
+  pos_separador = text.find(" / ")
+  if pos_separador != -1:
+    text = text[:pos_separador]
+  text = extractors.replacement_engine.apply(text)
+  text = text.strip()
+  words_in_string = text.split()
+  if words_in_string and words_in_string[0] in word_array:
+      text = ' '.join(words_in_string[1:])
+  suffixes = [" s ", " s, ", ", ", " s", " s,", " s, en", ",", ",  "]
+  for suffix in suffixes:
+    if text.endswith(suffix):
+      text = text[:-len(suffix)]
+  return text
+
+# Lines whose quantity, unit and modifiers were read wrong before, with what the tokenizer must read from them
+cases = [
+  (' 1/2 taza de vino tinto', 0.5, 'taza', []),
+  ('1 y 1/2 kg de carne', 1.5, 'kg', []),
+  ('1 1/2 taza de harina', 1.5, 'taza', []),
+  ('2 / 3 taza de azucar', 2 / 3, 'taza', []),
+  ('1 cucharada de azucar', 1, 'cucharada', []),
+  ('3 dientes de ajo', 3, 'diente', []),
+  ('2 latas de tomate', 2, 'lata', []),
+  ('1,5 l de agua', 1.5, 'l', []),
+  ('sobre la mesa', None, None, []),
+  ('sal o pimienta', None, None, ['pimienta']),
+  ('manteca / margarina', None, None, ['margarina']),
+  ('1 litro de leche (entera) o crema', 1, 'l', ['entera', 'crema']),
+]
+
+# The cases the tokenizer reads wrong, as (line, expected, read) messages
+def wrong_cases():
+  wrong = []
+  for line, quantity, unit, modifiers in cases:
+    token = tokenize(line)
+    if (token["quantity"], token["unit"], token["modifiers"]) != (quantity, unit, modifiers):
+      wrong.append(f'{line!r}: expected {(quantity, unit, modifiers)}, read {(token["quantity"], token["unit"], token["modifiers"])}')
+  return wrong
+
+def collect_lines():
+  lines = []
+  apply_transformations = extractors.apply_transformations
+  def recording(text):
+    lines.append(text)
+    return apply_transformations(text)
+  extractors.apply_transformations = recording
+  # Turn the normalizer cache off so repeated lines reach apply_transformations every time
+  maxsize = extractors.normalizer.maxsize
+  extractors.normalizer.maxsize = 0
+  extractors.normalizer.cache.clear()
+  try:
+    for site in SITES.values():
+      for task in cleaning.page_tasks(site, f'{cleaning.raw_directory}/{site.name}-html'):
+        cleaning.extract_page(task)
+  finally:
+    extractors.apply_transformations = apply_transformations
+    extractors.normalizer.maxsize = maxsize
+  return lines
+
+# Median microseconds per line over the runs, without keeping the results (a list of dicts would bring the garbage
+# collector in)
+def timed(function, lines, runs):
+  seconds = []
+  for _ in range(runs):
+    started = time.perf_counter()
+    for line in lines:
+      function(line)
+    seconds.append(time.perf_counter() - started)
+  return statistics.median(seconds) / len(lines) * 1e6
+
+# Replacements that change nothing, to time the steps around the replacements table alone
+class NoReplacements:
+  def apply(self, text):
+    return text
+
+def start(runs=7):
+  lines = collect_lines()
+  expected = [transform_reference(line) for line in lines]
+  tokens = [tokenize(line) for line in lines]
+  mismatches = [(line, a, b["name"]) for line, a, b in zip(lines, expected, tokens) if a != b["name"]]
+  for line, a, b in mismatches[:10]:
+    print(f'Mismatch for {line!r}: {a!r} != {b!r}')
+  wrong = wrong_cases()
+  for message in wrong:
+    print('Wrong case', message)
+
+  chain = timed(transform_reference, lines, runs)
+  tokenizer = timed(tokenize, lines, runs)
+  replacements = timed(extractors.replacement_engine.apply, lines, runs)
+  engine = extractors.replacement_engine
+  extractors.replacement_engine = NoReplacements()
+  try:
+    chain_steps = timed(transform_reference, lines, runs)
+    tokenizer_steps = timed(tokenize, lines, runs)
+  finally:
+    extractors.replacement_engine = engine
+
+  with_quantity = sum(1 for token in tokens if token["quantity"] is not None)
+  with_unit = sum(1 for token in tokens if token["unit"] is not None)
+  print(f'{len(lines)} lines, {len(mismatches)} name mismatches, {with_quantity} with a quantity, {with_unit} with a unit, {len(cases) - len(wrong)}/{len(cases)} cases right')
+  print(f'median of {runs} runs, us/line     with replacements   without')
+  print(f'transformation chain               {chain:8.1f}       {chain_steps:8.1f}')
+  print(f'tokenizer                          {tokenizer:8.1f}       {tokenizer_steps:8.1f}')
+  print(f'replacements table alone           {replacements:8.1f}')
+  print(f'chain / tokenizer                  {chain / tokenizer:8.2f}x      {chain_steps / tokenizer_steps:8.2f}x')
+  return not mismatches and not wrong
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--raw-directory', default=cleaning.raw_directory)
+  parser.add_argument('--runs', type=int, default=7, help='Timing runs over the lines, the median is reported')
+  args = parser.parse_args()
+  cleaning.raw_directory = args.raw_directory
+  raise SystemExit(0 if start(args.runs) else 1)
@@ -0,0 +1,299 @@
+# Counting of the ingredient pairs that appear together in recipes. A pair is a pair of ingredient ids (ids follow
+# the alphabetical order of the names, so the first id is the first name in alphabetical order), and pairs are
+# listed in the order they are first met going through the recipes and, within a recipe, through its ingredient
+# pairs (i, j), i < j, in order; that is the order of the original nested loop of 2_pairing_ingredients.py.
+import multiprocessing  # For the sharded counting
+import os  # For the spilled runs
+import tempfile  # For the directory of the spilled runs
+import numpy as np  # For the index arrays
+import scipy.sparse as sparse  # For the co-occurrence product
+
+# Reference implementation: the original loop over the pairs of every recipe, with a dict of name pairs
+def count_pairs_serial(recipes):
+  ingredient_pairs = {}
+  for recipe in recipes:
+    ingredients = recipe["ingredients"]
+    for i in range(len(ingredients)):
+      for j in range(i + 1, len(ingredients)):
+        pair = tuple(sorted([ingredients[i], ingredients[j]]))
+        ingredient_pairs[pair] = ingredient_pairs.get(pair, 0) + 1
+  return ingredient_pairs
+
+# Pairs (first ids, second ids) of the recipes of rows start to end of a CSR matrix, with the position of each
+# pair in the order of the nested loop counted from the first pair of row start. Rows with the same number of
+# ingredients are expanded together through the upper triangle indices of that size.
+def enumerate_pairs(indptr, indices, start, end):
+  lengths = np.diff(indptr[start:end + 1])
+  pair_counts = lengths * (lengths - 1) // 2
+  offsets = np.concatenate(([0], np.cumsum(pair_counts, dtype=np.int64)))
+  total = int(offsets[-1])
+  first = np.empty(total, dtype=np.int64)
+  second = np.empty(total, dtype=np.int64)
+  for length in np.unique(lengths[lengths > 1]):
+    rows = np.flatnonzero(lengths == length)
+    members = indices[indptr[start + rows][:, None] + np.arange(length)]
+    upper_i, upper_j = np.triu_indices(length, 1)
+    positions = (offsets[rows][:, None] + np.arange(len(upper_i))).ravel()
+    a = members[:, upper_i].ravel()
+    b = members[:, upper_j].ravel()
+    first[positions] = np.minimum(a, b)
+    second[positions] = np.maximum(a, b)
+  return first, second
+
+# Ranges of rows whose pairs add up to at most chunk_pairs (or one row if it alone has more)
+def row_chunks(indptr, chunk_pairs):
+  lengths = np.diff(indptr).astype(np.int64)
+  cumulative = np.cumsum(lengths * (lengths - 1) // 2)
+  start = 0
+  while start < len(lengths):
+    base = cumulative[start - 1] if start else 0
+    end = max(int(np.searchsorted(cumulative, base + chunk_pairs, side='right')), start + 1)
+    yield start, end
+    start = end
+
+# Co-occurrence counts of the binary recipe x ingredient CSR matrix X: the upper triangle of X^T X, computed as one
+# sparse product. The order of first appearance is recovered by enumerating the pairs of the recipes in chunks of
+# at most chunk_pairs pairs and keeping the smallest loop position of every pair.
+# Returns (first ids, second ids, counts) arrays in that order.
+def count_pairs_sparse(indptr, indices, vocabulary_size, chunk_pairs=1 << 22):
+  recipes = len(indptr) - 1
+  matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(recipes, vocabulary_size))
+  products = sparse.triu(matrix.T @ matrix, k=1).tocoo()
+  keys = products.row.astype(np.int64) * vocabulary_size + products.col
+  order = np.argsort(keys)
+  keys = keys[order]
+  counts = products.data[order]
+
+  first_seen = np.full(len(keys), np.iinfo(np.int64).max)
+  seen = 0
+  for start, end in row_chunks(indptr, chunk_pairs):
+    first, second = enumerate_pairs(indptr, indices, start, end)
+    # First position of every distinct pair of the chunk; looking up the sorted distinct keys is cache friendly
+    chunk_keys, chunk_first = np.unique(first * vocabulary_size + second, return_index=True)
+    positions = np.searchsorted(keys, chunk_keys)
+    first_seen[positions] = np.minimum(first_seen[positions], seen + chunk_first)
+    seen += len(first)
+
+  order = np.argsort(first_seen, kind='stable')
+  return keys[order] // vocabulary_size, keys[order] % vocabulary_size, counts[order]
+
+# Count table of the pairs of rows start to end: sorted packed keys (first id * vocabulary_size + second id), their
+# counts and the loop position (from the first pair of row start) where each pair is first met
+def count_table(indptr, indices, vocabulary_size, start, end, chunk_pairs=1 << 22):
+  tables = []
+  seen = 0
+  for chunk_start, chunk_end in row_chunks(indptr[start:end + 1] - indptr[start], chunk_pairs):
+    first, second = enumerate_pairs(indptr, indices, start + chunk_start, start + chunk_end)
+    keys, first_seen, counts = np.unique(first * vocabulary_size + second, return_index=True, return_counts=True)
+    tables.append((keys, counts, seen + first_seen))
+    seen += len(first)
+  return merge_tables(tables)
+
+# Reduce count tables given in loop order into one: the tables are concatenated and stably sorted by key (NumPy
+# merges the sorted runs), the counts of equal keys are added and the earliest position is kept
+def merge_tables(tables):
+  keys = np.concatenate([table[0] for table in tables]) if tables else np.empty(0, dtype=np.int64)
+  if not len(keys):
+    return keys, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+  order = np.argsort(keys, kind='stable')
+  keys = keys[order]
+  starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+  counts = np.add.reduceat(np.concatenate([table[1] for table in tables])[order], starts)
+  first_seen = np.minimum.reduceat(np.concatenate([table[2] for table in tables])[order], starts)
+  return keys[starts], counts, first_seen
+
+# Matrix arrays of a pool worker, set once by the pool initializer instead of being sent with every shard
+shard_matrix = None
+
+def set_shard_matrix(indptr, indices, vocabulary_size):
+  global shard_matrix
+  shard_matrix = (indptr, indices, vocabulary_size)
+
+# Count table of one shard (a range of rows), run by the pool workers
+def count_shard(rows):
+  indptr, indices, vocabulary_size = shard_matrix
+  return count_table(indptr, indices, vocabulary_size, *rows)
+
+# Ranges of rows splitting the pairs of the matrix into about equal shards
+def shard_rows(indptr, shards):
+  lengths = np.diff(indptr).astype(np.int64)
+  total = int((lengths * (lengths - 1) // 2).sum())
+  return list(row_chunks(indptr, max(-(-total // shards), 1)))
+
+# Map-reduce counting: the rows are split into shards of about the same number of pairs, each shard is counted
+# into a table by a pool of worker processes (map), and the tables are merged in shard order (reduce), with the
+# positions of each shard offset by the pairs of the shards before it. Returns the same arrays as count_pairs_sparse.
+def count_pairs_sharded(indptr, indices, vocabulary_size, workers, shards=None):
+  rows = shard_rows(indptr, shards or workers * 4)
+  lengths = np.diff(indptr).astype(np.int64)
+  pair_offsets = np.concatenate(([0], np.cumsum(lengths * (lengths - 1) // 2)))
+  with multiprocessing.Pool(workers, initializer=set_shard_matrix, initargs=(indptr, indices, vocabulary_size)) as pool:
+    tables = [(keys, counts, pair_offsets[start] + first_seen)
+              for (start, _), (keys, counts, first_seen) in zip(rows, pool.imap(count_shard, rows))]
+
+  keys, counts, first_seen = merge_tables(tables)
+  order = np.argsort(first_seen, kind='stable')
+  return keys[order] // vocabulary_size, keys[order] % vocabulary_size, counts[order]
+
+# Rows of the count tables spilled to disk by the streaming counter
+TABLE = np.dtype([('key', np.int64), ('count', np.int64), ('first', np.int64)])
+
+# Packed keys of the pairs of the recipes, in loop order, a batch of about batch_pairs pairs at a time. Ingredient
+# names are interned into ids in order of appearance (names gets the new ones), and a pair of ids a < b is packed
+# as a << 32 | b, so the keys need no vocabulary size known in advance.
+def pair_key_batches(recipes, names, batch_pairs):
+  ids = { name: i for i, name in enumerate(names) }
+  indptr = [0]
+  indices = []
+  pending = 0
+  for recipe in recipes:
+    for name in recipe["ingredients"]:
+      if name not in ids:
+        ids[name] = len(names)
+        names.append(name)
+      indices.append(ids[name])
+    indptr.append(len(indices))
+    length = indptr[-1] - indptr[-2]
+    pending += length * (length - 1) // 2
+    if pending >= batch_pairs:
+      yield batch_keys(indptr, indices)
+      indptr, indices, pending = [0], [], 0
+  if pending:
+    yield batch_keys(indptr, indices)
+
+def batch_keys(indptr, indices):
+  indptr = np.array(indptr, dtype=np.int64)
+  first, second = enumerate_pairs(indptr, np.array(indices, dtype=np.int64), 0, len(indptr) - 1)
+  return (first << 32) | second
+
+# Count table (TABLE rows sorted by key) of a batch of keys whose first pair is at loop position seen
+def key_table(keys, seen):
+  unique_keys, first_seen, counts = np.unique(keys, return_index=True, return_counts=True)
+  table = np.empty(len(unique_keys), dtype=TABLE)
+  table['key'], table['count'], table['first'] = unique_keys, counts, seen + first_seen
+  return table
+
+# Merge of sorted run files (raw TABLE rows sorted by field) reading block_rows rows of each run at a time. Every
+# round takes the rows up to the smallest last value of the blocks of the runs not yet read to the end, which no later
+# row of any run can come before, and passes them (in run order) to reduce, which returns them sorted by field.
+def merge_runs(run_files, field, block_rows, reduce):
+  files = [open(run_file, 'rb') for run_file in run_files]
+  try:
+    blocks = [np.empty(0, dtype=TABLE) for _ in files]
+    read_all = [False] * len(files)
+    while True:
+      for k, file in enumerate(files):
+        if not len(blocks[k]) and not read_all[k]:
+          blocks[k] = np.fromfile(file, dtype=TABLE, count=block_rows)
+          read_all[k] = len(blocks[k]) < block_rows
+      if not any(len(block) for block in blocks):
+        return
+      unfinished = [block[field][-1] for block, done in zip(blocks, read_all) if not done]
+      bound = min(unfinished) if unfinished else None
+      taken = []
+      for k, block in enumerate(blocks):
+        end = len(block) if bound is None else int(np.searchsorted(block[field], bound, side='right'))
+        taken.append(block[:end])
+        blocks[k] = block[end:]
+      yield reduce(np.concatenate(taken))
+  finally:
+    for file in files:
+      file.close()
+
+# Rows of equal keys added up, the earliest position kept, sorted by key
+def reduce_keys(rows):
+  rows = rows[np.argsort(rows['key'], kind='stable')]
+  starts = np.flatnonzero(np.concatenate(([True], rows['key'][1:] != rows['key'][:-1])))
+  table = np.empty(len(starts), dtype=TABLE)
+  table['key'] = rows['key'][starts]
+  table['count'] = np.add.reduceat(rows['count'], starts)
+  table['first'] = np.minimum.reduceat(rows['first'], starts)
+  return table
+
+def sort_first(rows):
+  return rows[np.argsort(rows['first'], kind='stable')]
+
+# External sort: the tables (each sorted by field) are written as runs and merged back in order of field,
+# unless there is only one, which is given back as it is
+def sorted_tables(tables, field, directory, block_rows, reduce):
+  tables = iter(tables)
+  held = next(tables, None)
+  run_files = []
+  for table in tables:
+    for spilled in ([held, table] if held is not None else [table]):
+      run_files.append(os.path.join(directory, f'{field}-{len(run_files)}.bin'))
+      spilled.tofile(run_files[-1])
+    held = None
+  if not run_files:
+    if held is not None:
+      yield held
+    return
+  yield from merge_runs(run_files, field, max(block_rows // len(run_files), 1024), reduce)
+
+# Tables of at most buffer_rows rows, each sorted by field, from a stream of tables
+def buffered_tables(tables, buffer_rows, sort):
+  buffer, size = [], 0
+  for table in tables:
+    buffer.append(table)
+    size += len(table)
+    if size >= buffer_rows:
+      yield sort(np.concatenate(buffer))
+      buffer, size = [], 0
+  if buffer:
+    yield sort(np.concatenate(buffer))
+
+# Streaming counting in bounded memory: the recipes are read one at a time and their pairs counted a batch of
+# buffer_pairs pairs at a time into a count table sorted by key, spilled as a run to a temporary directory (under
+# directory). The runs are merged by key adding up the counts, and the merged pairs are sorted by position of first
+# appearance the same way, so at most about buffer_pairs pairs are in memory at a time.
+# Yields (ing1, ing2, count) in the order of count_pairs_serial.
+def count_pairs_streaming(recipes, buffer_pairs=1 << 22, directory=None):
+  names = []
+  with tempfile.TemporaryDirectory(dir=directory) as spill_directory:
+    def batch_tables():
+      seen = 0
+      for keys in pair_key_batches(recipes, names, buffer_pairs):
+        yield key_table(keys, seen)
+        seen += len(keys)
+    by_key = sorted_tables(batch_tables(), 'key', spill_directory, buffer_pairs, reduce_keys)
+    by_first = sorted_tables(buffered_tables(by_key, buffer_pairs, sort_first), 'first', spill_directory, buffer_pairs, sort_first)
+    for table in by_first:
+      for key in table[['key', 'count']].tolist():
+        pair = sorted((names[key[0] >> 32], names[key[0] & 0xFFFFFFFF]))
+        yield pair[0], pair[1], key[1]
+
+# Approximate top pairs for previews of huge corpora: a Count-Min sketch (depth rows of width counters, width a
+# power of two, with multiply-shift hashes) counts every pair in fixed memory and never underestimates, and the
+# top * 4 pairs with the highest estimates are kept as candidates, estimated again after every batch.
+# Returns the top (ing1, ing2, estimated count) by decreasing estimate.
+def top_pairs_sketch(recipes, top, width=1 << 20, depth=4, batch_pairs=1 << 20, seed=0):
+  bits = int(width).bit_length() - 1
+  generator = np.random.default_rng(seed)
+  multipliers = generator.integers(1, 2 ** 63, size=depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+  sketch = np.zeros((depth, 1 << bits), dtype=np.int64)
+
+  def buckets(keys):
+    return [((keys.astype(np.uint64) * multiplier) >> np.uint64(64 - bits)).astype(np.int64) for multiplier in multipliers]
+
+  def estimates(keys):
+    return np.min([sketch[row][bucket] for row, bucket in enumerate(buckets(keys))], axis=0)
+
+  names = []
+  candidates = np.empty(0, dtype=np.int64)
+  for keys in pair_key_batches(recipes, names, batch_pairs):
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    for row, bucket in enumerate(buckets(unique_keys)):
+      sketch[row] += np.bincount(bucket, weights=counts, minlength=len(sketch[row])).astype(np.int64)
+    candidates = np.union1d(candidates, unique_keys)
+    if len(candidates) > top * 4:
+      candidates = candidates[np.argpartition(-estimates(candidates), top * 4)[:top * 4]]
+
+  if not len(candidates):
+    return []
+  values = estimates(candidates)
+  order = np.lexsort((candidates, -values))[:top]
+  result = []
+  for key, value in zip(candidates[order].tolist(), values[order].tolist()):
+    pair = sorted((names[key >> 32], names[key & 0xFFFFFFFF]))
+    result.append((pair[0], pair[1], value))
+  return result
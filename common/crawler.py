@@ -0,0 +1,314 @@
+# Asynchronous crawl engine shared by the scraping scripts
+import asyncio  # For running many requests concurrently
+from collections import namedtuple  # For the fetched page record
+import random  # For the jitter of retry delays
+import time  # For spacing out requests to the same host
+from urllib.parse import urlsplit  # For grouping requests by host
+import aiohttp  # For the pooled keep-alive HTTP client
+from common.metrics import CrawlMetrics  # For the per-host telemetry
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Result of a fetch as handed to the handlers
+Page = namedtuple('Page', ['status', 'headers', 'body'])
+
+# A queued fetch. stream, if set, is a factory of consumers with feed(chunk) and close() methods:
+# the body is fed to a fresh consumer as it arrives and the handler gets what close() returns as the page body.
+Job = namedtuple('Job', ['url', 'handler', 'args', 'headers', 'stream', 'attempt'])
+
+# Statuses worth retrying: rate limiting and server side errors. Any other status is handed to the handler.
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Raised for responses with a retryable status
+class RetryableStatus(Exception):
+  def __init__(self, page):
+    super().__init__(f'HTTP {page.status}')
+    self.page = page
+
+# Whether a failed fetch may succeed if tried again
+def is_retryable(error):
+  return isinstance(error, (RetryableStatus, aiohttp.ClientError, asyncio.TimeoutError))
+
+# Seconds the server asked us to wait in a Retry-After header, if any
+def retry_after(error):
+  if isinstance(error, RetryableStatus):
+    value = error.page.headers.get('Retry-After', '')
+    if value.isdigit():
+      return float(value)
+  return None
+
+# Politeness budget for a single host: caps the requests in flight and spaces out their start times.
+# Start slots are handed out in-process unless reserve_slot(delay) is given, which returns the wall clock
+# time to start at from a store shared with other processes; it is called from a thread, as it may block.
+class HostBudget:
+  def __init__(self, concurrency, delay, reserve_slot=None):
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self.delay = delay
+    self.reserve_slot = reserve_slot
+    self.next_slot = 0.0
+    self.lock = asyncio.Lock()
+
+  async def __aenter__(self):
+    await self.semaphore.acquire()
+    # Reserve the next free start slot for this host and wait for it
+    async with self.lock:
+      if self.reserve_slot:
+        # The shared store may wait for another process's lock, so it is asked from a thread, off the event loop
+        start = await asyncio.to_thread(self.reserve_slot, self.delay)
+        now = time.time()
+      else:
+        now = time.monotonic()
+        start = max(now, self.next_slot)
+        self.next_slot = start + self.delay
+    if start > now:
+      await asyncio.sleep(start - now)
+    return self
+
+  async def __aexit__(self, *exc_info):
+    self.semaphore.release()
+
+# Circuit breaker for a single host: after too many consecutive failures the host is left alone
+# for a cooldown, then requests are let through again and the first success closes the circuit
+class CircuitBreaker:
+  def __init__(self, threshold, cooldown):
+    self.threshold = threshold
+    self.cooldown = cooldown
+    self.failures = 0
+    self.open_until = 0.0
+
+  # Wait while the circuit is open
+  async def wait(self):
+    while True:
+      remaining = self.open_until - time.monotonic()
+      if remaining <= 0:
+        return
+      await asyncio.sleep(remaining)
+
+  def record_success(self):
+    self.failures = 0
+
+  def record_failure(self):
+    self.failures += 1
+    if self.failures >= self.threshold:
+      print('Circuit open for', self.cooldown, 'seconds after', self.failures, 'consecutive failures')
+      self.open_until = time.monotonic() + self.cooldown
+      self.failures = 0
+
+# Timestamps of the phases of a request, filled in by aiohttp's tracing hooks
+async def on_request_start(session, context, params):
+  context.trace_request_ctx['start'] = time.monotonic()
+
+async def on_dns_start(session, context, params):
+  context.trace_request_ctx['dns_start'] = time.monotonic()
+
+async def on_dns_end(session, context, params):
+  context.trace_request_ctx['dns_end'] = time.monotonic()
+
+async def on_connection_start(session, context, params):
+  context.trace_request_ctx['connect_start'] = time.monotonic()
+
+async def on_connection_end(session, context, params):
+  context.trace_request_ctx['connect_end'] = time.monotonic()
+
+async def on_connection_reuse(session, context, params):
+  context.trace_request_ctx['reused'] = True
+
+async def on_request_end(session, context, params):
+  context.trace_request_ctx['headers'] = time.monotonic()
+
+def trace_config():
+  config = aiohttp.TraceConfig()
+  config.on_request_start.append(on_request_start)
+  config.on_dns_resolvehost_start.append(on_dns_start)
+  config.on_dns_resolvehost_end.append(on_dns_end)
+  config.on_connection_create_start.append(on_connection_start)
+  config.on_connection_create_end.append(on_connection_end)
+  config.on_connection_reuseconn.append(on_connection_reuse)
+  config.on_request_end.append(on_request_end)
+  return config
+
+# Durations of the phases of a traced request
+def phase_timings(trace, end):
+  timings = {}
+  if 'dns_end' in trace:
+    timings['dns'] = trace['dns_end'] - trace['dns_start']
+  if 'connect_end' in trace:
+    timings['connect'] = trace['connect_end'] - trace['connect_start']
+  if 'headers' in trace:
+    timings['ttfb'] = trace['headers'] - trace['start']
+  if 'start' in trace:
+    timings['total'] = end - trace['start']
+  return timings
+
+# Crawl engine: a queue of (url, handler) jobs drained by a fixed number of workers sharing one connection pool.
+# Failed fetches are retried with exponential backoff and jitter; urls that still fail after max_attempts
+# go to the dead letter list and, if given, to the on_dead(url, reason, handler, *args) callback.
+# Timings, bytes, statuses and retries of every request are recorded per host in crawler.metrics,
+# and a progress line per host is printed every report_interval seconds (0 turns it off).
+# reserve_slot(host, delay), if given, shares the per-host start slots with other crawler processes.
+# Handlers may be coroutine functions; the CPU bound work they hand to run_blocking (parsing pages) runs in executor,
+# if given (e.g. a process pool), so it does not hold up the downloads of the other workers.
+class Crawler:
+  def __init__(self, concurrency=16, per_host_concurrency=4, per_host_delay=0.25, timeout=30,
+               max_attempts=5, backoff_base=1.0, backoff_cap=60.0, breaker_threshold=5, breaker_cooldown=30.0, on_dead=None,
+               report_interval=10, reserve_slot=None, executor=None):
+    self.concurrency = concurrency
+    self.per_host_concurrency = per_host_concurrency
+    self.per_host_delay = per_host_delay
+    self.timeout = timeout
+    self.max_attempts = max_attempts
+    self.backoff_base = backoff_base
+    self.backoff_cap = backoff_cap
+    self.breaker_threshold = breaker_threshold
+    self.breaker_cooldown = breaker_cooldown
+    self.on_dead = on_dead
+    self.report_interval = report_interval
+    self.reserve_slot = reserve_slot
+    self.executor = executor
+    self.metrics = CrawlMetrics()
+    self.queue = asyncio.Queue()
+    self.hosts = {}
+    self.breakers = {}
+    self.retries = set()
+    self.dead_letters = []
+    self.seen = set()
+    self.session = None
+
+  # Add a url to the crawl; the handler is called as handler(crawler, url, page, *args) once it is fetched.
+  # Extra request headers (e.g. If-None-Match for conditional requests) can be passed with headers.
+  def enqueue(self, url, handler, *args, headers=None, stream=None):
+    if url in self.seen:
+      return False
+    self.seen.add(url)
+    self.queue.put_nowait(Job(url, handler, args, headers, stream, 1))
+    return True
+
+  def host_budget(self, url):
+    host = urlsplit(url).netloc
+    if host not in self.hosts:
+      reserve_slot = (lambda delay: self.reserve_slot(host, delay)) if self.reserve_slot else None
+      self.hosts[host] = HostBudget(self.per_host_concurrency, self.per_host_delay, reserve_slot)
+    return self.hosts[host]
+
+  def circuit_breaker(self, url):
+    host = urlsplit(url).netloc
+    if host not in self.breakers:
+      self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+    return self.breakers[host]
+
+  # Download a single url through the shared session, respecting the host's politeness budget and circuit breaker
+  async def fetch(self, url, headers=None, stream=None):
+    host = urlsplit(url).netloc
+    breaker = self.circuit_breaker(url)
+    await breaker.wait()
+    trace = {}
+    try:
+      async with self.host_budget(url):
+        async with self.session.get(url, headers=headers, trace_request_ctx=trace) as response:
+          if stream and response.status == 200:
+            consumer = stream()
+            size = 0
+            async for chunk in response.content.iter_chunked(65536):
+              size += len(chunk)
+              consumer.feed(chunk)
+            page = Page(response.status, response.headers, consumer.close())
+          else:
+            page = Page(response.status, response.headers, await response.read())
+            size = len(page.body)
+      self.metrics.record_response(host, page.status, phase_timings(trace, time.monotonic()), size)
+      if trace.get('reused'):
+        self.metrics.record_reuse(host)
+      if page.status in RETRY_STATUSES:
+        raise RetryableStatus(page)
+    except Exception as e:
+      if not isinstance(e, RetryableStatus):
+        self.metrics.record_error(host, e)
+      if is_retryable(e):
+        breaker.record_failure()
+      raise
+    breaker.record_success()
+    return page
+
+  # Result of function(*args), computed in the executor off the event loop, or right here if there is none
+  async def run_blocking(self, function, *args):
+    if self.executor is None:
+      return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+  # Delay before the given attempt: exponential backoff with full jitter, or what the server asked for
+  def backoff(self, attempt, error):
+    requested = retry_after(error)
+    if requested is not None:
+      return min(requested, self.backoff_cap)
+    return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1)))
+
+  # Put a job back in the queue after its backoff delay
+  def retry_later(self, job, delay):
+    async def requeue():
+      await asyncio.sleep(delay)
+      self.queue.put_nowait(job)
+
+    task = asyncio.create_task(requeue())
+    self.retries.add(task)
+    task.add_done_callback(self.retries.discard)
+
+  def dead_letter(self, url, reason, handler, args):
+    print('Giving up on', url, reason)
+    self.dead_letters.append((url, reason))
+    self.metrics.record_dead(urlsplit(url).netloc)
+    if self.on_dead:
+      self.on_dead(url, reason, handler, *args)
+
+  async def worker(self):
+    while True:
+      job = await self.queue.get()
+      try:
+        page = await self.fetch(job.url, job.headers, job.stream)
+      except Exception as e:
+        if is_retryable(e) and job.attempt < self.max_attempts:
+          self.metrics.record_retry(urlsplit(job.url).netloc)
+          self.retry_later(job._replace(attempt=job.attempt + 1), self.backoff(job.attempt, e))
+        else:
+          self.dead_letter(job.url, repr(e), job.handler, job.args)
+        self.queue.task_done()
+        continue
+
+      try:
+        result = job.handler(self, job.url, page, *job.args)
+        if asyncio.iscoroutine(result):
+          await result
+      except Exception as e:
+        print('Handler failed', job.url, repr(e))
+      finally:
+        self.queue.task_done()
+
+  # Print the progress of every host at a fixed interval
+  async def reporter(self):
+    while True:
+      await asyncio.sleep(self.report_interval)
+      for line in self.metrics.progress():
+        print(line)
+
+  # Run until the queue (including urls enqueued by handlers) is empty. A feeder coroutine function,
+  # called with the crawler, can keep adding jobs; the crawl then also waits for it to return.
+  async def run(self, feeder=None):
+    connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_concurrency, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=self.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={"User-Agent": USER_AGENT}, trace_configs=[trace_config()]) as session:
+      self.session = session
+      workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+      if self.report_interval:
+        workers.append(asyncio.create_task(self.reporter()))
+      try:
+        if feeder:
+          await feeder(self)
+        # Retries waiting out their backoff are not in the queue, so wait for them to come back too
+        await self.queue.join()
+        while self.retries:
+          await asyncio.wait(list(self.retries))
+          await self.queue.join()
+      finally:
+        for task in workers + list(self.retries):
+          task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.session = None
@@ -0,0 +1,214 @@
+# Normalization of ingredient texts, shared by the extractors of every site
+import hashlib  # For the version of the normalization rules
+import json  # For the persisted cache
+import os  # For checking the cache file exists
+import re  # For regular expressions
+import sys  # For finding the source of the replacement engine
+from collections import OrderedDict  # For the LRU cache
+from common.replacements import replacements  # Custom replacements for text cleaning
+from common.multireplace import ReplacementEngine  # For applying all the replacements in a few scans
+
+# Built once from the replacements table; gives the same result as applying them one by one with str.replace
+replacement_engine = ReplacementEngine(replacements)
+
+# Words dropped after the leading quantity or at the start of the text, from the name only. This is not a list of
+# units: 'cucharada' 'taza' is one string ('cucharadataza'), 'g.' or 'gr.' match any character after the g, and 's'
+# and 'de' are in it, as they always were, so the names stay the same.
+word_array = ['unidades', 'unidad', 'lonchas', 'loncha', 'onzas', 'piezas', 'onza', 'pieza', 'gramos', 'vasos', 'vaso', 'mililitros', 'kilogramos', 'kilogramo', 's', 'g', 'g.', 'gr', 'gr.', 'cc', 'cucharadas', 'cucharadita', 'cucharada' 'taza', 'tazas', 'ml', 'kg', 'kgr', 'litro', 'porciones', 'de', 'cc.', 'cda', 'cdas', 'cdas.', 'cdita', 'cdtas..']
+words = frozenset(word_array)
+
+# Units of measure, as written in the recipes (without trailing dots) -> the unit reported for them
+unit_lexicon = {
+  'g': 'g', 'gr': 'g', 'grs': 'g', 'gramo': 'g', 'gramos': 'g',
+  'kg': 'kg', 'kgr': 'kg', 'kgs': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogramo': 'kg', 'kilogramos': 'kg',
+  'ml': 'ml', 'cc': 'ml', 'mililitro': 'ml', 'mililitros': 'ml',
+  'l': 'l', 'lt': 'l', 'lts': 'l', 'litro': 'l', 'litros': 'l',
+  'taza': 'taza', 'tazas': 'taza', 'tza': 'taza', 'tz': 'taza',
+  'cucharada': 'cucharada', 'cucharadas': 'cucharada', 'cda': 'cucharada', 'cdas': 'cucharada',
+  'cucharadita': 'cucharadita', 'cucharaditas': 'cucharadita', 'cdita': 'cucharadita', 'cditas': 'cucharadita', 'cdta': 'cucharadita', 'cdtas': 'cucharadita',
+  'vaso': 'vaso', 'vasos': 'vaso', 'lata': 'lata', 'latas': 'lata', 'diente': 'diente', 'dientes': 'diente',
+  'unidad': 'unidad', 'unidades': 'unidad', 'pieza': 'pieza', 'piezas': 'pieza', 'loncha': 'loncha', 'lonchas': 'loncha',
+  'feta': 'feta', 'fetas': 'feta', 'rodaja': 'rodaja', 'rodajas': 'rodaja', 'onza': 'onza', 'onzas': 'onza', 'oz': 'onza',
+  'pizca': 'pizca', 'pizcas': 'pizca', 'sobre': 'sobre', 'sobres': 'sobre', 'paquete': 'paquete', 'paquetes': 'paquete',
+  'atado': 'atado', 'atados': 'atado', 'ramita': 'ramita', 'ramitas': 'ramita', 'punado': 'punado', 'punados': 'punado',
+  'porcion': 'porcion', 'porciones': 'porcion', 'chorro': 'chorro', 'chorrito': 'chorro',
+}
+
+# Patterns compiled once instead of on every line
+parentheses_pattern = re.compile(r'\(([^)]*)\)')
+quantity_pattern = re.compile(r"^(\d+)\s*("+'|'.join(word_array)+r")?\s*")
+# The measure at the start of a line, in one match: a quantity (whole, decimal, fraction, or a whole number and a
+# fraction, with or without 'y' between them) and, only after it, a unit of the lexicon (longest forms first, dots
+# allowed after it)
+measure_pattern = re.compile(r'(?:(\d+)(?:[.,](\d+)|\s+(?:y\s+)?(\d+)\s*/\s*(\d+)|\s*/\s*(\d+))?\s*'
+                             r'(?:(' + '|'.join(sorted(unit_lexicon, key=len, reverse=True)) + r')\.*(?![a-z]))?)?')
+# Where an alternative starts: " o ", or a " / " that is not the slash of a fraction
+alternative_patterns = [re.compile(r' o '), re.compile(r'(?<!\d) / (?!\d)')]
+numbers_pattern = re.compile(r'\d+')
+suffixes = [" s ", " s, ", ", ", " s", " s,", " s, en", ",", ",  "]
+
+# Quantity, unit and end of the measure at the start of a text without parentheses, None for each one it lacks
+def measure(text):
+  match = measure_pattern.match(text)
+  whole, decimals, numerator, denominator, divisor, unit = match.groups()
+  quantity = None
+  if whole is not None:
+    quantity = int(whole)
+    if decimals is not None:
+      quantity = float(f'{whole}.{decimals}')
+    elif numerator is not None and int(denominator):
+      quantity += int(numerator) / int(denominator)
+    elif divisor is not None and int(divisor):
+      quantity /= int(divisor)
+  return quantity, unit_lexicon.get(unit), match.end()
+
+# Alternatives of the text after the measure: what follows the first " o ", then what follows the first " / " before
+# it, as the name is cut, but found in the text as written so the slash of a fraction does not start one
+def alternatives(text):
+  found = []
+  for pattern in alternative_patterns:
+    match = pattern.search(text)
+    if match:
+      found.append(text[match.end():].strip())
+      text = text[:match.start()]
+  return found
+
+# Function to split an ingredient text into its quantity, unit, name and modifiers (the texts in parentheses
+# and the alternatives after " o " or " / "). The quantity, unit and alternatives are read from the text as written,
+# without its leading spaces; the name is the normalized ingredient text, built by the same steps as always, each one
+# only run when the text can contain what it removes.
+def tokenize(text):
+  modifiers = []
+
+  # Remove content between parentheses, including the parentheses themselves
+  if '(' in text:
+    modifiers.extend(modifier.strip() for modifier in parentheses_pattern.findall(text))
+    text = parentheses_pattern.sub('', text)
+
+  stripped = text.lstrip()
+  quantity, unit, end = measure(stripped)
+  modifiers.extend(alternatives(stripped[end:]))
+
+  # Remove quantity of each ingredient
+  if text[:1].isdigit():
+    text = text[quantity_pattern.match(text).end():]
+
+  # Remove numbers
+  text = numbers_pattern.sub('', text)
+
+  # Remove text after "o" and after "/"
+  for separator in (" o ", " / "):
+    pos_separador = text.find(separator)
+    if pos_separador != -1:
+      text = text[:pos_separador]
+
+  # Apply custom replacements defined in the replacements module
+  text = replacement_engine.apply(text)
+
+  text = text.strip()
+
+  # Remove the first word if it's in the word_array
+  words_in_string = text.split()
+  if words_in_string and words_in_string[0] in words:
+    text = ' '.join(words_in_string[1:])
+
+  # Remove common suffixes
+  for suffix in suffixes:
+    if text.endswith(suffix):
+      text = text[:-len(suffix)]
+
+  return { "quantity": quantity, "unit": unit, "name": text, "modifiers": [modifier for modifier in modifiers if modifier] }
+
+# Function to apply text transformations to ingredient text
+def apply_transformations(text):
+  return tokenize(text)["name"]
+
+# Function to remove certain words from an ingredient text
+def remove_entire(ing):
+  entire_string = ["y", "de", ",", "s", "en s", 'en rusa', "en", "des", "bon", "ados", "ado", "adas", "aceit", "gr", "cc", "cdas"]
+  for ent in entire_string:
+    if ing == ent:
+      ing = ''
+
+  prefixes = ["de "]
+  for prefix in prefixes:
+    if ing.startswith(prefix):
+      ing = ing[len(prefix):]
+
+  return ing.strip()
+
+# Version of the normalization rules: changes whenever the replacements table or the code of this module or of the
+# replacement engine changes
+def rules_version():
+  digest = hashlib.sha256(json.dumps(replacements).encode('utf-8'))
+  for source in (__file__, sys.modules[ReplacementEngine.__module__].__file__):
+    with open(source, 'rb') as file:
+      digest.update(file.read())
+  return digest.hexdigest()
+
+# Memoized normalization of ingredient lines: apply_transformations, the split into ingredients and
+# remove_entire, run once per distinct unidecoded line. The cache keeps the maxsize most recently used
+# lines and can be saved and loaded between runs; a saved cache from other rules is ignored.
+class IngredientNormalizer:
+  def __init__(self, maxsize=100000):
+    self.maxsize = maxsize
+    self.cache = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.version = rules_version()
+
+  # Ingredient names of a line, in order and without the empty ones. The recetasgratis extractor
+  # splits the transformed text without stripping it first, which strip=False reproduces.
+  def normalize(self, line, strip=True):
+    key = (line, strip)
+    names = self.cache.get(key)
+    if names is not None:
+      self.hits += 1
+      self.cache.move_to_end(key)
+      return names
+
+    self.misses += 1
+    text = apply_transformations(line)
+    if strip:
+      text = text.strip()
+    names = tuple(name for name in (remove_entire(ing) for ing in text.split(', ')) if name) if text else ()
+    self.cache[key] = names
+    if len(self.cache) > self.maxsize:
+      self.cache.popitem(last=False)
+    return names
+
+  def hit_rate(self):
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.0
+
+  def stats(self):
+    return { "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate(), "size": len(self.cache), "maxsize": self.maxsize }
+
+  def save(self, path):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+      json.dump({ "version": self.version, "entries": [[line, strip, list(names)] for (line, strip), names in self.cache.items()] }, file)
+    os.replace(temp_path, path)
+
+  # Load a saved cache, returning whether it was usable
+  def load(self, path):
+    if not os.path.exists(path):
+      return False
+    with open(path, 'r', encoding='utf-8') as file:
+      saved = json.load(file)
+    if saved["version"] != self.version:
+      return False
+    for line, strip, names in saved["entries"][-self.maxsize:]:
+      self.cache[(line, strip)] = tuple(names)
+    return True
+
+# Normalizer shared by the extractors of every site
+normalizer = IngredientNormalizer()
+
+# Function to format the title of a recipe
+def format_title(title):
+  title = str(title.text)
+  title_stripped = title.strip()
+  # Remove non-ASCII characters
+  title_cleaned = re.sub(r'[^\x00-\x7F]+', '', title_stripped)
+  return title_cleaned
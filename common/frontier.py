@@ -0,0 +1,155 @@
+# Durable crawl frontier backed by SQLite
+import sqlite3  # For the on-disk url table
+from collections import namedtuple  # For the stored cache validators
+import threading  # For reserving host slots from the crawler's threads
+import time  # For recording discovery and fetch times
+
+# Possible states of a url in the frontier
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+# Urls that kept failing to download after every retry (the dead letter list)
+DEAD = 'dead'
+
+# What is known about the last saved copy of a page, used to issue conditional requests
+Validators = namedtuple('Validators', ['etag', 'last_modified', 'content_hash'])
+
+# Columns added after the first version of the table, created on open if missing
+EXTRA_COLUMNS = [
+  ('etag', 'TEXT'),
+  ('last_modified', 'TEXT'),
+  ('content_hash', 'TEXT'),
+  ('changed_at', 'REAL'),
+  ('lease_owner', 'TEXT'),
+  ('lease_expires', 'REAL'),
+]
+
+# Every url known to the crawler with its source site, state and the outcome of its last fetch.
+# The url column is the primary key, so membership checks and updates are index lookups.
+# The worker processes sharing it must run on the machine whose local disk holds it: SQLite's WAL mode relies on
+# shared memory and file locks that network filesystems do not provide.
+class Frontier:
+  def __init__(self, path):
+    self.path = path
+    # Connection of reserve_slot, opened on first use in the thread that calls it
+    self.slots_db = None
+    self.slots_lock = threading.Lock()
+    # Several worker processes may share the database, so wait for their write locks instead of failing
+    self.db = sqlite3.connect(path, timeout=60)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('PRAGMA synchronous=NORMAL')
+    self.db.execute('''
+      CREATE TABLE IF NOT EXISTS urls (
+        url TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        state TEXT NOT NULL,
+        discovered_at REAL NOT NULL,
+        fetched_at REAL,
+        status INTEGER,
+        outcome TEXT
+      )
+    ''')
+    columns = [row[1] for row in self.db.execute('PRAGMA table_info(urls)')]
+    for name, type_ in EXTRA_COLUMNS:
+      if name not in columns:
+        self.db.execute(f'ALTER TABLE urls ADD COLUMN {name} {type_}')
+    self.db.execute('CREATE INDEX IF NOT EXISTS urls_source_state ON urls (source, state)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS urls_state_lease ON urls (state, lease_expires)')
+    self.db.execute('CREATE TABLE IF NOT EXISTS host_slots (host TEXT PRIMARY KEY, next_slot REAL NOT NULL)')
+    self.db.commit()
+
+  def __contains__(self, url):
+    return self.db.execute('SELECT 1 FROM urls WHERE url = ?', (url,)).fetchone() is not None
+
+  def __len__(self):
+    return self.db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+  # Record a newly discovered url; returns False if it was already known
+  def add(self, source, url, state=PENDING):
+    cursor = self.db.execute(
+      'INSERT OR IGNORE INTO urls (url, source, state, discovered_at) VALUES (?, ?, ?, ?)',
+      (url, source, state, time.time())
+    )
+    self.db.commit()
+    return cursor.rowcount == 1
+
+  # Record the outcome of fetching a url, releasing its lease
+  def mark(self, url, state, status=None, outcome=None):
+    self.db.execute(
+      'UPDATE urls SET state = ?, fetched_at = ?, status = ?, outcome = ?, lease_owner = NULL, lease_expires = NULL WHERE url = ?',
+      (state, time.time(), status, outcome, url)
+    )
+    self.db.commit()
+
+  # Record the validators of a freshly saved copy of a page; changed_at only moves when the content hash does
+  def mark_saved(self, url, status, outcome, etag, last_modified, content_hash):
+    now = time.time()
+    self.db.execute(
+      '''UPDATE urls SET state = ?, fetched_at = ?, status = ?, outcome = ?, etag = ?, last_modified = ?, lease_owner = NULL, lease_expires = NULL,
+         changed_at = CASE WHEN content_hash IS ? THEN changed_at ELSE ? END, content_hash = ? WHERE url = ?''',
+      (DONE, now, status, outcome, etag, last_modified, content_hash, now, content_hash, url)
+    )
+    self.db.commit()
+
+  def validators(self, url):
+    row = self.db.execute('SELECT etag, last_modified, content_hash FROM urls WHERE url = ?', (url,)).fetchone()
+    return Validators(*row) if row else Validators(None, None, None)
+
+  def state(self, url):
+    row = self.db.execute('SELECT state FROM urls WHERE url = ?', (url,)).fetchone()
+    return row[0] if row else None
+
+  # Urls of a source in a given state, in discovery order
+  def urls(self, source, state=PENDING):
+    rows = self.db.execute('SELECT url FROM urls WHERE source = ? AND state = ? ORDER BY rowid', (source, state))
+    return [row[0] for row in rows]
+
+  # Put every url in a state back to pending, e.g. the saved ones for a distributed recrawl
+  def requeue(self, state):
+    self.db.execute('UPDATE urls SET state = ?, lease_owner = NULL, lease_expires = NULL WHERE state = ?', (PENDING, state))
+    self.db.commit()
+
+  # Take up to limit pending urls that nobody holds a live lease on, as (source, url) pairs.
+  # Leases that were not renewed in time (e.g. their worker died) have expired and are handed out again.
+  def lease(self, owner, limit, seconds):
+    now = time.time()
+    with self.db:
+      self.db.execute('BEGIN IMMEDIATE')
+      rows = self.db.execute(
+        'SELECT source, url FROM urls WHERE state = ? AND (lease_expires IS NULL OR lease_expires < ?) ORDER BY rowid LIMIT ?',
+        (PENDING, now, limit)
+      ).fetchall()
+      self.db.executemany(
+        'UPDATE urls SET lease_owner = ?, lease_expires = ? WHERE url = ?',
+        [(owner, now + seconds, url) for _, url in rows]
+      )
+    return rows
+
+  # Extend the leases of a worker that is still alive
+  def heartbeat(self, owner, seconds):
+    self.db.execute('UPDATE urls SET lease_expires = ? WHERE lease_owner = ? AND state = ?', (time.time() + seconds, owner, PENDING))
+    self.db.commit()
+
+  # Number of pending urls, leased or not; the distributed crawl is over when it reaches zero
+  def pending_count(self):
+    return self.db.execute('SELECT COUNT(*) FROM urls WHERE state = ?', (PENDING,)).fetchone()[0]
+
+  # Reserve the next start slot for a request to a host, shared by every process using the database,
+  # so a host's rate limit holds however many workers there are. Returns the wall clock time to start at.
+  # It may wait for another process's write lock, so the crawler calls it from a thread, with a connection of its own.
+  def reserve_slot(self, host, delay):
+    with self.slots_lock:
+      if self.slots_db is None:
+        self.slots_db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+      now = time.time()
+      with self.slots_db:
+        self.slots_db.execute('BEGIN IMMEDIATE')
+        row = self.slots_db.execute('SELECT next_slot FROM host_slots WHERE host = ?', (host,)).fetchone()
+        start = max(now, row[0]) if row else now
+        self.slots_db.execute('INSERT OR REPLACE INTO host_slots (host, next_slot) VALUES (?, ?)', (host, start + delay))
+      return start
+
+  def close(self):
+    if self.slots_db is not None:
+      self.slots_db.close()
+    self.db.close()
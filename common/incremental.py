@@ -0,0 +1,157 @@
+# Incremental upkeep of what the pairing, recommendation matrix and tf-idf stages compute, so adding or removing a
+# few recipes does not mean going over the whole corpus again.
+#
+# The index keeps the recipes in the order they were added, the recipes using each ingredient, the count of every
+# pair and where it is first met, the symmetric recommendation matrix rows and the number of pairs of each ingredient.
+# An update only touches the pairs of the added and removed recipes and the rows of their ingredients, and the result
+# is what the stages compute from the recipes left in that order, with the added ones at the end.
+import json  # For the index file
+from math import log  # For the tf-idf weights
+
+class CooccurrenceIndex:
+  def __init__(self):
+    self.recipes = {}  # url -> sequence number of the recipe
+    self.by_sequence = {}  # sequence number -> (url, ingredients)
+    self.next_sequence = 0
+    self.postings = {}  # ingredient -> sequence numbers of the recipes using it
+    self.counts = {}  # (ing1, ing2) -> count, ing1 <= ing2
+    self.first = {}  # (ing1, ing2) -> (sequence number, i, j) of the recipe and positions where the pair is first met
+    self.matrix = {}  # ingredient -> { ingredient: count }, the symmetric recommendation matrix
+    self.document_frequency = {}  # ingredient -> number of pairs with it, the df of the tf-idf stage
+    self.source = None  # What the owner identifies the recipes the index was last in step with by, saved with it
+
+  # Index of the given recipes, as the stages would count them
+  @classmethod
+  def from_recipes(cls, recipes):
+    index = cls()
+    index.update(added=recipes)
+    return index
+
+  # Remove the recipes (by url) and then add the others at the end; an added recipe whose url is known replaces it.
+  # Returns the set of ingredients whose rows changed.
+  def update(self, added=(), removed=()):
+    affected = set()
+    for recipe in removed:
+      self.remove(recipe["url"], affected)
+    for recipe in added:
+      if recipe["url"] in self.recipes:
+        self.remove(recipe["url"], affected)
+      self.add(recipe, affected)
+    return affected
+
+  def add(self, recipe, affected):
+    sequence = self.next_sequence
+    self.next_sequence += 1
+    ingredients = list(recipe["ingredients"])
+    self.recipes[recipe["url"]] = sequence
+    self.by_sequence[sequence] = (recipe["url"], ingredients)
+    for name in ingredients:
+      self.postings.setdefault(name, set()).add(sequence)
+    for i, j, pair in recipe_pairs(ingredients):
+      if pair not in self.counts:
+        self.counts[pair] = 0
+        self.first[pair] = (sequence, i, j)
+        self.document_frequency[pair[0]] = self.document_frequency.get(pair[0], 0) + 1
+        self.document_frequency[pair[1]] = self.document_frequency.get(pair[1], 0) + 1
+      self.counts[pair] += 1
+      self.adjust(pair, 1, affected)
+
+  def remove(self, url, affected):
+    if url not in self.recipes:
+      return
+    sequence = self.recipes.pop(url)
+    _, ingredients = self.by_sequence.pop(sequence)
+    for name in ingredients:
+      self.postings[name].discard(sequence)
+      if not self.postings[name]:
+        del self.postings[name]
+    for _, _, pair in recipe_pairs(ingredients):
+      self.counts[pair] -= 1
+      self.adjust(pair, -1, affected)
+      if not self.counts[pair]:
+        del self.counts[pair], self.first[pair]
+        for name in pair:
+          self.document_frequency[name] -= 1
+          if not self.document_frequency[name]:
+            del self.document_frequency[name]
+      elif self.first[pair][0] == sequence:
+        self.first[pair] = self.first_occurrence(pair)
+
+  # Add delta to both cells of the pair in the matrix, dropping the cells and rows that reach zero
+  def adjust(self, pair, delta, affected):
+    for a, b in (pair, pair[::-1]):
+      row = self.matrix.setdefault(a, {})
+      row[b] = row.get(b, 0) + delta
+      if not row[b]:
+        del row[b]
+        if not row:
+          del self.matrix[a]
+      affected.add(a)
+
+  # (sequence number, i, j) where the pair is first met among the recipes left: the first recipe using both
+  # ingredients, at its first positions i < j holding them
+  def first_occurrence(self, pair):
+    sequence = min(self.postings[pair[0]] & self.postings[pair[1]])
+    _, ingredients = self.by_sequence[sequence]
+    return next((sequence, i, j) for i, j, other in recipe_pairs(ingredients) if other == pair)
+
+  # (ing1, ing2, count) of every pair in order of first appearance, as 2_pairing_ingredients.py lists them
+  def pairs(self):
+    return [(pair[0], pair[1], self.counts[pair]) for pair in sorted(self.counts, key=self.first.__getitem__)]
+
+  # The recommendation matrix, with its rows and cells in the order 3_recommendation_matrix.py builds them
+  # (pairs is what pairs() returns, to pass when it was already sorted)
+  def recommendation_matrix(self, pairs=None):
+    ordered = {}
+    for ing1, ing2, _ in self.pairs() if pairs is None else pairs:
+      ordered.setdefault(ing1, {})[ing2] = self.matrix[ing1][ing2]
+      ordered.setdefault(ing2, {})[ing1] = self.matrix[ing2][ing1]
+    return ordered
+
+  # tf-idf weight of a pair as 4_tf_idf.py computes it: the ingredients' pairs are their documents,
+  # so it is worked out from the current counts when asked for instead of being stored
+  def weight(self, ing1, ing2):
+    pairs = len(self.counts)
+    count = self.counts[(ing1, ing2)]
+    return count * log(pairs / self.document_frequency[ing1]) + count * log(pairs / self.document_frequency[ing2])
+
+  # The pairs with their tf-idf weights as counts, as 4_tf_idf.py writes them
+  def tf_idf_pairs(self, pairs=None):
+    pairs = self.pairs() if pairs is None else pairs
+    return [{"ing1": ing1, "ing2": ing2, "count": self.weight(ing1, ing2)} for ing1, ing2, _ in pairs]
+
+  def save(self, index_file):
+    with open(index_file, 'w', encoding='utf-8') as f:
+      json.dump({
+        "source": self.source,
+        "next_sequence": self.next_sequence,
+        "recipes": [[sequence, url, ingredients] for sequence, (url, ingredients) in self.by_sequence.items()],
+        "pairs": [[pair[0], pair[1], count, *self.first[pair]] for pair, count in self.counts.items()],
+      }, f)
+
+  @classmethod
+  def load(cls, index_file):
+    with open(index_file, 'r', encoding='utf-8') as file:
+      saved = json.load(file)
+    index = cls()
+    index.source = saved.get("source")
+    index.next_sequence = saved["next_sequence"]
+    for sequence, url, ingredients in saved["recipes"]:
+      index.recipes[url] = sequence
+      index.by_sequence[sequence] = (url, ingredients)
+      for name in ingredients:
+        index.postings.setdefault(name, set()).add(sequence)
+    for ing1, ing2, count, sequence, i, j in saved["pairs"]:
+      pair = (ing1, ing2)
+      index.counts[pair] = count
+      index.first[pair] = (sequence, i, j)
+      index.adjust(pair, count, set())
+      index.document_frequency[ing1] = index.document_frequency.get(ing1, 0) + 1
+      index.document_frequency[ing2] = index.document_frequency.get(ing2, 0) + 1
+    return index
+
+# (i, j, pair) of the ingredient pairs of a recipe in the order of the pairing loop, with the names of each pair sorted
+def recipe_pairs(ingredients):
+  for i in range(len(ingredients)):
+    for j in range(i + 1, len(ingredients)):
+      yield i, j, tuple(sorted([ingredients[i], ingredients[j]]))
@@ -0,0 +1,93 @@
+# Integer-interned ingredient vocabulary and sparse recipe x ingredient matrix, written by the cleaning stage so the
+# later stages can work on int32 arrays instead of repeated ingredient strings.
+#
+# The vocabulary file holds the ingredient names sorted alphabetically (an ingredient's id is its position, so
+# comparing ids orders ingredients like comparing their names) and their document frequency (number of recipes).
+# The matrix file is a NumPy .npz with the CSR arrays of the binary recipe x ingredient matrix: row r lists the ids
+# indices[indptr[r]:indptr[r + 1]] of the ingredients of the r-th recipe of formatted-recipes.json, in the order
+# the recipe lists them.
+import json  # For the vocabulary file and the recipes
+from array import array  # For growing the index arrays without a Python object per entry
+from collections import Counter  # For the document frequencies
+import numpy as np  # For the matrix arrays
+
+# Recipes of a JSON lines file, one at a time
+def read_recipes(lines_file):
+  with open(lines_file, 'r') as file:
+    for line in file:
+      yield json.loads(line)
+
+# Items of a JSON array file, one at a time, reading it block_size characters at a time
+def read_json_array(json_file, block_size=1 << 16):
+  decoder = json.JSONDecoder()
+  with open(json_file, 'r', encoding='utf-8') as file:
+    buffer = ''
+    started = False
+    while True:
+      buffer = buffer.lstrip().lstrip(',').lstrip() if started else buffer.lstrip()
+      if not started and buffer:
+        if buffer[0] != '[':
+          raise ValueError(f'{json_file} is not a JSON array')
+        buffer, started = buffer[1:], True
+        continue
+      if buffer.startswith(']'):
+        return
+      try:
+        item, end = decoder.raw_decode(buffer)
+      except json.JSONDecodeError:
+        more = file.read(block_size)
+        if not more:
+          raise
+        buffer += more
+        continue
+      yield item
+      buffer = buffer[end:]
+
+# Write the items as a JSON array to a file one at a time, byte for byte what json.dump(items, f, indent=4) writes
+def write_json_array(items, json_file):
+  with open(json_file, 'w') as f:
+    separator = '[\n    '
+    for item in items:
+      f.write(separator + json.dumps(item, indent=4).replace('\n', '\n    '))
+      separator = ',\n    '
+    f.write('[]' if separator == '[\n    ' else '\n]')
+
+# Build the vocabulary and matrix from the recipes of a JSON lines file in two streaming passes,
+# so only the distinct names and the int32 arrays are kept in memory
+def write_artifacts(lines_file, vocabulary_file, matrix_file):
+  document_frequency = Counter()
+  for recipe in read_recipes(lines_file):
+    # The extractors never repeat an ingredient within a recipe, so counting names counts recipes
+    document_frequency.update(recipe["ingredients"])
+  names = sorted(document_frequency)
+  ids = { name: i for i, name in enumerate(names) }
+
+  indptr = array('i', [0])
+  indices = array('i')
+  for recipe in read_recipes(lines_file):
+    indices.extend(ids[name] for name in recipe["ingredients"])
+    indptr.append(len(indices))
+
+  with open(vocabulary_file, 'w', encoding='utf-8') as f:
+    json.dump({ "names": names, "document_frequency": [document_frequency[name] for name in names] }, f)
+  np.savez(matrix_file, indptr=np.frombuffer(indptr, dtype=np.int32), indices=np.frombuffer(indices, dtype=np.int32),
+           shape=np.array([len(indptr) - 1, len(names)], dtype=np.int64))
+
+# Names (id -> name), indptr and indices of the recipes given as a list, for the stages that only have the recipes
+def build_matrix(recipes):
+  names = sorted({ name for recipe in recipes for name in recipe["ingredients"] })
+  ids = { name: i for i, name in enumerate(names) }
+  indices = np.array([ids[name] for recipe in recipes for name in recipe["ingredients"]], dtype=np.int32)
+  indptr = np.concatenate(([0], np.cumsum([len(recipe["ingredients"]) for recipe in recipes]))).astype(np.int32)
+  return names, indptr, indices
+
+# Names (id -> name) and document frequencies of a vocabulary file
+def load_vocabulary(vocabulary_file):
+  with open(vocabulary_file, 'r', encoding='utf-8') as file:
+    vocabulary = json.load(file)
+  return vocabulary["names"], np.array(vocabulary["document_frequency"], dtype=np.int32)
+
+# CSR arrays (indptr, indices) and (recipes, ingredients) shape of a matrix file
+def load_matrix(matrix_file):
+  with np.load(matrix_file) as arrays:
+    return arrays["indptr"], arrays["indices"], tuple(int(n) for n in arrays["shape"])
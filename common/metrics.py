@@ -0,0 +1,140 @@
+# Crawl telemetry: per-host request timings, bytes, status codes and retries
+import bisect  # For finding the bucket of a sample
+import json  # For the summary file
+import time  # For the run duration and throughput
+from collections import Counter  # For status and error counts
+
+# Upper bounds (in seconds) of the histogram buckets, roughly logarithmic from 1 ms to 2 minutes
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+# Latency histogram with fixed buckets, so its memory does not grow with the number of samples
+class Histogram:
+  def __init__(self):
+    self.counts = [0] * (len(BUCKETS) + 1)
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def add(self, value):
+    self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+    self.count += 1
+    self.total += value
+    self.min = value if self.min is None else min(self.min, value)
+    self.max = value if self.max is None else max(self.max, value)
+
+  # Upper bound of the bucket holding the given quantile, capped at the maximum seen
+  def quantile(self, q):
+    if not self.count:
+      return None
+    rank = q * self.count
+    seen = 0
+    for i, count in enumerate(self.counts):
+      seen += count
+      if seen >= rank and count:
+        return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+    return self.max
+
+  def summary(self):
+    if not self.count:
+      return { "count": 0 }
+    return {
+      "count": self.count,
+      "mean": self.total / self.count,
+      "min": self.min,
+      "p50": self.quantile(0.5),
+      "p90": self.quantile(0.9),
+      "p99": self.quantile(0.99),
+      "max": self.max,
+      "buckets": { str(bound): count for bound, count in zip(BUCKETS + ['inf'], self.counts) if count },
+    }
+
+# Phases of a request that get a histogram each
+PHASES = ['dns', 'connect', 'ttfb', 'total']
+
+class HostMetrics:
+  def __init__(self):
+    self.requests = 0
+    self.bytes = 0
+    self.retries = 0
+    self.dead = 0
+    self.reused_connections = 0
+    self.statuses = Counter()
+    self.errors = Counter()
+    self.timings = { phase: Histogram() for phase in PHASES }
+    # Histogram of total times since the last progress report
+    self.window = Histogram()
+
+  def summary(self, elapsed):
+    return {
+      "requests": self.requests,
+      "bytes": self.bytes,
+      "requests_per_second": self.requests / elapsed if elapsed else None,
+      "bytes_per_second": self.bytes / elapsed if elapsed else None,
+      "retries": self.retries,
+      "dead": self.dead,
+      "reused_connections": self.reused_connections,
+      "statuses": { str(status): count for status, count in sorted(self.statuses.items()) },
+      "errors": dict(self.errors),
+      "timings": { phase: histogram.summary() for phase, histogram in self.timings.items() },
+    }
+
+class CrawlMetrics:
+  def __init__(self):
+    self.hosts = {}
+    self.started = time.monotonic()
+    self.window_started = self.started
+
+  def host(self, host):
+    if host not in self.hosts:
+      self.hosts[host] = HostMetrics()
+    return self.hosts[host]
+
+  # Record a completed request; timings maps phase names to seconds (phases that did not happen are left out)
+  def record_response(self, host, status, timings, size):
+    metrics = self.host(host)
+    metrics.requests += 1
+    metrics.bytes += size
+    metrics.statuses[status] += 1
+    for phase, seconds in timings.items():
+      metrics.timings[phase].add(seconds)
+    if 'total' in timings:
+      metrics.window.add(timings['total'])
+
+  def record_error(self, host, error):
+    self.host(host).errors[type(error).__name__] += 1
+
+  def record_retry(self, host):
+    self.host(host).retries += 1
+
+  def record_dead(self, host):
+    self.host(host).dead += 1
+
+  def record_reuse(self, host):
+    self.host(host).reused_connections += 1
+
+  # One line per host with the throughput and latency since the previous report
+  def progress(self):
+    now = time.monotonic()
+    elapsed = now - self.window_started
+    lines = []
+    for host, metrics in sorted(self.hosts.items()):
+      window = metrics.window
+      if window.count:
+        lines.append(f'{host}: {window.count / elapsed:.1f} req/s, p50 {window.quantile(0.5):.3f}s, p90 {window.quantile(0.9):.3f}s, {metrics.requests} requests, {metrics.retries} retries')
+      metrics.window = Histogram()
+    self.window_started = now
+    return lines
+
+  def summary(self):
+    elapsed = time.monotonic() - self.started
+    return {
+      "elapsed_seconds": elapsed,
+      "requests": sum(metrics.requests for metrics in self.hosts.values()),
+      "bytes": sum(metrics.bytes for metrics in self.hosts.values()),
+      "hosts": { host: metrics.summary(elapsed) for host, metrics in sorted(self.hosts.items()) },
+    }
+
+  def write_summary(self, path):
+    with open(path, 'w') as f:
+      json.dump(self.summary(), f, indent=4)
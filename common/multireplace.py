@@ -0,0 +1,79 @@
+# Single-pass engine for an ordered list of [old, new] string replacements, equivalent to
+# applying text = text.replace(old, new) for every rule in order
+from bisect import bisect_right  # For finding the next rule of a pattern after the current one
+
+# Reference implementation: one full scan of the text per rule
+def replace_sequentially(text, rules):
+  for old, new in rules:
+    text = text.replace(old, new)
+  return text
+
+# An Aho-Corasick automaton over the patterns of the rules finds every pattern present in the text in one scan.
+# Rules whose pattern is absent leave the text unchanged, so only the first rule (after the last one applied)
+# whose pattern is present needs to run; the text is scanned again after each replacement because a
+# replacement can create or destroy occurrences of later patterns. Most lines match a handful of rules,
+# so a line costs a few scans instead of one per rule, with the same result as replace_sequentially.
+class ReplacementEngine:
+  def __init__(self, rules):
+    self.rules = [(old, new) for old, new in rules]
+    # Rule indices of every pattern, in order; rules that replace a pattern by itself never change the text
+    self.positions = {}
+    for i, (old, new) in enumerate(self.rules):
+      if old != new:
+        self.positions.setdefault(old, []).append(i)
+    self.build(self.positions)
+
+  def build(self, patterns):
+    self.goto = [{}]
+    self.output = [[]]
+    for pattern in patterns:
+      state = 0
+      for char in pattern:
+        if char not in self.goto[state]:
+          self.goto.append({})
+          self.output.append([])
+          self.goto[state][char] = len(self.goto) - 1
+        state = self.goto[state][char]
+      self.output[state].append(pattern)
+
+    # Breadth-first pass setting the failure link of every state below the first level (those fail to the root)
+    # and merging the outputs along it
+    self.fail = [0] * len(self.goto)
+    queue = list(self.goto[0].values())
+    for state in queue:
+      for char, next_state in self.goto[state].items():
+        queue.append(next_state)
+        fallback = self.fail[state]
+        while fallback and char not in self.goto[fallback]:
+          fallback = self.fail[fallback]
+        self.fail[next_state] = self.goto[fallback].get(char, 0)
+        self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+  # Set of the patterns that occur in the text
+  def matches(self, text):
+    found = set()
+    goto, fail, output = self.goto, self.fail, self.output
+    state = 0
+    for char in text:
+      while state and char not in goto[state]:
+        state = fail[state]
+      state = goto[state].get(char, 0)
+      if output[state]:
+        found.update(output[state])
+    return found
+
+  def apply(self, text):
+    current = -1
+    while True:
+      # First rule after the current one whose pattern occurs in the text
+      next_rule = None
+      for pattern in self.matches(text):
+        indices = self.positions[pattern]
+        k = bisect_right(indices, current)
+        if k < len(indices) and (next_rule is None or indices[k] < next_rule):
+          next_rule = indices[k]
+      if next_rule is None:
+        return text
+      old, new = self.rules[next_rule]
+      text = text.replace(old, new)
+      current = next_rule
@@ -0,0 +1,200 @@
+# Packed storage for raw HTML pages: one compressed blob per page appended to a single archive file,
+# plus an index mapping each page name to the offset, length and content hash of its blob.
+#
+# The index file is an append-only journal: every write appends one JSON line [name, offset, length, content hash],
+# and a later line for a name replaces the earlier ones. Writing a page costs one short append whatever the size of
+# the pack, and a process sharing the pack only reads the lines the others appended since it last looked.
+# save_index() (after bulk writes and compact()) rewrites the journal with one line per page. An index written by
+# older versions as a single JSON object is still read, and rewritten as a journal on the first write.
+from contextlib import contextmanager  # For closing a site's pack at the end of a with block
+import fcntl  # For locking a pack shared by several writer processes
+import hashlib  # For the content hash of each page
+import json  # For the index file
+import mmap  # For reading the archive without copying it into memory
+import os  # For checking and replacing files
+import zlib  # For compressing each page
+
+# Every blob starts with this magic so a corrupt offset is detected instead of decompressing garbage
+BLOB_MAGIC = b'PK01'
+
+# Decode a stored page the same way open(..., 'r', encoding='utf-8') decodes a loose HTML file
+def decode_html(data):
+  return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+# Names of the loose files of a site's HTML directory that its pack (None if there is none) does not hold.
+# A site fetched partly before and partly after the migration to packs has pages in both places; the pack's copy
+# of a page is the newest, and the loose files are the ones written before it existed.
+def loose_files(html_files_directory, pack=None):
+  if not os.path.isdir(html_files_directory):
+    return []
+  return [file_name for file_name in os.listdir(html_files_directory) if pack is None or file_name not in pack]
+
+# Names of a site's pages as (name, in pack): the pages of its pack (None if there is none) in archive order, then
+# the loose files the pack does not hold
+def iter_pages(html_files_directory, pack=None):
+  if pack is not None:
+    for name in pack.names():
+      yield name, True
+  for name in loose_files(html_files_directory, pack):
+    yield name, False
+
+# Raw bytes of a site's page: the pack's copy if its pack (None if there is none) holds it, else the loose file,
+# None if the page is in neither
+def read_page(html_files_directory, name, pack=None):
+  if pack is not None and name in pack:
+    return pack.read(name)
+  file_path = os.path.join(html_files_directory, name)
+  if not os.path.exists(file_path):
+    return None
+  with open(file_path, 'rb') as file:
+    return file.read()
+
+# The pack next to a site's HTML directory, None if the site has none
+def open_pack(html_files_directory, shared=False):
+  pack_file = html_files_directory + '.pack'
+  return Pack(pack_file, shared) if os.path.exists(pack_file) else None
+
+# open_pack for a with block, closing the pack at its end
+@contextmanager
+def site_pack(html_files_directory, shared=False):
+  pack = open_pack(html_files_directory, shared)
+  try:
+    yield pack
+  finally:
+    if pack is not None:
+      pack.close()
+
+# A pack opened with shared=True can be written by several processes at once: every write takes an
+# exclusive lock and reads the journal lines the others appended first, so their entries are kept
+class Pack:
+  def __init__(self, path, shared=False):
+    self.path = path
+    self.index_path = path + '.idx'
+    self.shared = shared
+    self.index = {}
+    self.map = None
+    self.load_index()
+
+  def load_index(self):
+    self.index = {}
+    self.pending = []  # Journal lines of the writes not saved yet (sync=False)
+    self.index_position = 0  # Bytes of the journal read so far
+    self.index_inode = None  # The journal read, to notice it was rewritten by save_index() in another process
+    self.legacy_index = False
+    self.read_journal()
+
+  # Read the journal lines appended since the last read. A journal replaced by save_index() is read again from the
+  # start, and a last line still being written (without its newline) is left for the next read.
+  def read_journal(self):
+    if not os.path.exists(self.index_path):
+      return
+    with open(self.index_path, 'rb') as file:
+      inode = os.fstat(file.fileno()).st_ino
+      if inode != self.index_inode:
+        self.index, self.index_position, self.index_inode = {}, 0, inode
+      file.seek(self.index_position)
+      data = file.read()
+    if self.index_position == 0 and data.startswith(b'{'):
+      self.index = json.loads(data)
+      self.index_position = len(data)
+      self.legacy_index = True
+      return
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+      if line.strip():
+        name, offset, length, content_hash = json.loads(line)
+        self.index[name] = [offset, length, content_hash]
+    self.index_position += end
+
+  def __contains__(self, name):
+    return name in self.index
+
+  def __len__(self):
+    return len(self.index)
+
+  # Names of the stored pages in archive order, so reading them in turn is a sequential scan
+  def names(self):
+    return sorted(self.index, key=lambda name: self.index[name][0])
+
+  def content_hash(self, name):
+    return self.index[name][2] if name in self.index else None
+
+  def read(self, name):
+    if self.map is None:
+      with open(self.path, 'rb') as file:
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    offset, length, _ = self.index[name]
+    if self.map[offset:offset + len(BLOB_MAGIC)] != BLOB_MAGIC:
+      raise ValueError(f'Corrupt pack entry {name} in {self.path}')
+    return zlib.decompress(self.map[offset + len(BLOB_MAGIC):offset + length])
+
+  # Yield (name, data) for every page in archive order
+  def items(self):
+    for name in self.names():
+      yield name, self.read(name)
+
+  # Append a page; replacing a name leaves its old blob in the archive until compact() is run.
+  # Bulk writers can pass sync=False and call save_index() once at the end.
+  def write(self, name, data, sync=True):
+    self.close()
+    blob = BLOB_MAGIC + zlib.compress(data, 9)
+    lock = open(self.path + '.lock', 'w') if self.shared else None
+    try:
+      if lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        self.read_journal()
+      with open(self.path, 'ab') as file:
+        offset = file.tell()
+        file.write(blob)
+      self.index[name] = [offset, len(blob), hashlib.sha256(data).hexdigest()]
+      self.pending.append(json.dumps([name, *self.index[name]]) + '\n')
+      if sync or lock:
+        self.flush_index()
+    finally:
+      if lock:
+        lock.close()
+
+  # Append the pending journal lines in one write
+  def flush_index(self):
+    if self.legacy_index:
+      self.save_index()
+      return
+    data = ''.join(self.pending).encode('utf-8')
+    with open(self.index_path, 'ab') as file:
+      file.write(data)
+      if self.index_inode is None:
+        self.index_inode = os.fstat(file.fileno()).st_ino
+    self.index_position += len(data)
+    self.pending = []
+
+  # Rewrite the journal with one line per page
+  def save_index(self):
+    temp_path = self.index_path + '.tmp'
+    data = ''.join(json.dumps([name, *entry]) + '\n' for name, entry in self.index.items()).encode('utf-8')
+    with open(temp_path, 'wb') as file:
+      file.write(data)
+      inode = os.fstat(file.fileno()).st_ino
+    os.replace(temp_path, self.index_path)
+    self.index_position, self.index_inode = len(data), inode
+    self.pending = []
+    self.legacy_index = False
+
+  # Rewrite the archive keeping only the blobs the index points to
+  def compact(self):
+    temp_path = self.path + '.tmp'
+    index = {}
+    with open(self.path, 'rb') as source, open(temp_path, 'wb') as file:
+      for name in self.names():
+        offset, length, content_hash = self.index[name]
+        source.seek(offset)
+        index[name] = [file.tell(), length, content_hash]
+        file.write(source.read(length))
+    self.close()
+    os.replace(temp_path, self.path)
+    self.index = index
+    self.save_index()
+
+  def close(self):
+    if self.map is not None:
+      self.map.close()
+      self.map = None
@@ -0,0 +1,35 @@
+# Parsing of raw recipe pages into BeautifulSoup trees, with a choice of parser backend and of building
+# the whole tree or only the parts of the page the site's extractor reads
+import hashlib  # For the version of the extraction
+import sys  # For finding the source of the site extractors
+from bs4 import BeautifulSoup  # For parsing HTML
+
+# Backend used unless another one is asked for; the extractors were written against its trees
+DEFAULT_PARSER = 'html.parser'
+
+# Parser backends BeautifulSoup can use here: the pure Python one always, lxml (C) when it is installed
+def available_parsers():
+  parsers = [DEFAULT_PARSER]
+  try:
+    import lxml  # noqa: F401
+    parsers.append('lxml')
+  except ImportError:
+    pass
+  return parsers
+
+# Parse a page. With strain, only the subtrees matched by the site's parse_only strainer are built,
+# which skips scripts, navigation and the rest of the page the extractor never looks at.
+def parse(html, site=None, parser=DEFAULT_PARSER, strain=False):
+  parse_only = site.parse_only if strain and site is not None else None
+  return BeautifulSoup(html, parser, parse_only=parse_only)
+
+# Version of everything that shapes a recipe: the normalization rules, the code of the site extractors and the
+# parsing (this module, the backend and strain). Recipes made with another version must be extracted again.
+def extraction_version(parser=DEFAULT_PARSER, strain=False):
+  from common.extractors import rules_version
+  from common.sites import SITES
+  digest = hashlib.sha256(f'{rules_version()} {parser} {strain}'.encode('utf-8'))
+  for module_name in sorted({ type(site).__module__ for site in SITES.values() } | { 'common.sites.base', __name__ }):
+    with open(sys.modules[module_name].__file__, 'rb') as file:
+      digest.update(file.read())
+  return digest.hexdigest()
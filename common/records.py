@@ -0,0 +1,23 @@
+# Recipe records extracted at fetch time, stored as JSON lines next to the raw HTML pack of each site
+import json  # For encoding each record
+import os  # For checking the records file exists
+
+# Append the record extracted from a page, with the extraction version it was made with (see
+# common.parsing.extraction_version); a later record for the same page supersedes earlier ones
+def append_record(records_file, file_name, content_hash, recipe, version):
+  with open(records_file, 'a', encoding='utf-8') as f:
+    f.write(json.dumps({ "file_name": file_name, "content_hash": content_hash, "recipe": recipe, "version": version }) + '\n')
+
+# Load the latest record of every page, keyed by page name
+def load_records(records_file):
+  records = {}
+  if not os.path.exists(records_file):
+    return records
+
+  with open(records_file, 'r', encoding='utf-8') as file:
+    for line in file:
+      if line.strip():
+        record = json.loads(line)
+        records[record["file_name"]] = record
+
+  return records
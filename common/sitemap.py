@@ -0,0 +1,60 @@
+# Streaming parser for sitemap.xml files and sitemap indexes (https://www.sitemaps.org/protocol.html)
+import xml.etree.ElementTree as ET  # For the incremental XML parser
+import zlib  # For gzipped sitemaps
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Consumer for the crawler's stream option: parses a sitemap chunk by chunk, without keeping the
+# whole document or tree in memory, and returns its entries as ('sitemap', url) or ('url', url) pairs
+class SitemapParser:
+  def __init__(self):
+    self.parser = ET.XMLPullParser(events=('start', 'end'))
+    self.root = None
+    self.decompressor = None
+    self.started = False
+    self.entries = []
+    self.loc = None
+    self.failed = False
+
+  def feed(self, chunk):
+    if self.failed:
+      return
+    # Sitemaps served as .xml.gz files are not decompressed by the HTTP client
+    if not self.started:
+      self.started = True
+      if chunk.startswith(GZIP_MAGIC):
+        self.decompressor = zlib.decompressobj(wbits=47)
+    if self.decompressor:
+      chunk = self.decompressor.decompress(chunk)
+    try:
+      self.parser.feed(chunk)
+      self.read_events()
+    except ET.ParseError as e:
+      print('Invalid sitemap', repr(e))
+      self.failed = True
+
+  def read_events(self):
+    for event, element in self.parser.read_events():
+      if event == 'start':
+        if self.root is None:
+          self.root = element
+        continue
+      # Tags come with their namespace, e.g. {http://www.sitemaps.org/schemas/sitemap/0.9}loc
+      tag = element.tag.rsplit('}', 1)[-1]
+      if tag == 'loc':
+        self.loc = (element.text or '').strip()
+      elif tag in ('url', 'sitemap'):
+        if self.loc:
+          self.entries.append((tag, self.loc))
+        self.loc = None
+        # Drop the finished entries so the tree does not grow with the document
+        self.root.clear()
+
+  def close(self):
+    if not self.failed:
+      try:
+        self.parser.close()
+        self.read_events()
+      except ET.ParseError as e:
+        print('Invalid sitemap', repr(e))
+    return self.entries
@@ -0,0 +1,3 @@
+# Registry of the recipe sites; importing a site module registers it
+from common.sites.base import Site, SITES, register
+from common.sites import cookpad, recetasgratis, saborargento
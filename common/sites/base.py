@@ -0,0 +1,70 @@
+# Interface every recipe site implements, so the scraper and the cleaning stage can handle all of them the same way
+import re  # For matching recipe urls found in sitemaps
+
+# Registered sites by name, in registration order
+SITES = {}
+
+# Add a site to the registry; used as a class decorator by the site modules
+def register(site_class):
+  site = site_class()
+  SITES[site.name] = site
+  return site_class
+
+class Site:
+  # Short name used for the raw files of the site (raw/<name>-urls, raw/<name>-html.pack, ...)
+  name = None
+  # Origin of the site's canonical urls
+  site_url = None
+  # Tag and class of the links to recipes on a listing page
+  listing_link = None
+  # Tag and class of an element that only recipe pages have
+  recipe_marker = None
+  # Pattern of the recipe urls among all the urls listed in the site's sitemaps
+  recipe_url_pattern = None
+  # Sitemaps to read when robots.txt does not list any
+  sitemap_paths = ['/sitemap.xml']
+  # SoupStrainer for the parts of a recipe page the extractor reads, None to always build the whole page
+  parse_only = None
+
+  def __init__(self):
+    # Origin requests are sent to; can be pointed at a local server serving the raw pages
+    self.base_url = self.site_url
+
+  # Listing pages to discover recipes from, as (page, path) pairs
+  def listing_pages(self):
+    raise NotImplementedError
+
+  def listing_file_name(self, page):
+    return f'output-{self.name}-{page}.json'
+
+  # Links to recipes found on a listing page
+  def links(self, soup):
+    tag, class_ = self.listing_link
+    return [link.get("href") for link in soup.find_all(tag, class_=class_)]
+
+  # Canonical url of a recipe link as found on a listing page
+  def canonical_url(self, href):
+    return href
+
+  # Url a canonical url is fetched from
+  def fetch_url(self, url):
+    if not url.startswith(self.site_url):
+      return url
+    return self.base_url + url[len(self.site_url):]
+
+  # Whether a url listed in a sitemap is a recipe of this site
+  def is_recipe_url(self, url):
+    return self.recipe_url_pattern is not None and re.search(self.recipe_url_pattern, url) is not None
+
+  # Name of the page of a recipe url in the site's raw store
+  def file_name(self, url):
+    raise NotImplementedError
+
+  # Page validator: whether a fetched page is really a recipe
+  def is_recipe(self, soup):
+    tag, class_ = self.recipe_marker
+    return len(soup.find_all(tag, class_=class_)) > 0
+
+  # Extractor: the recipe record ({ title, ingredients, url }) of a parsed recipe page
+  def extract(self, soup, file_name):
+    raise NotImplementedError
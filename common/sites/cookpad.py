@@ -0,0 +1,40 @@
+# Cookpad (cookpad.com/ar)
+from bs4 import SoupStrainer  # For parsing only the parts of a page the extractor reads
+from unidecode import unidecode  # For converting Unicode characters to ASCII
+from common.extractors import normalizer, format_title
+from common.sites.base import Site, register
+
+@register
+class Cookpad(Site):
+  name = 'cookpad'
+  site_url = 'https://cookpad.com'
+  listing_link = ("a", "block-link__main")
+  recipe_marker = ("div", "text-cookpad-gray-500")
+  recipe_url_pattern = r'^https://cookpad\.com/ar/recetas/\d+'
+  # Title and ingredients are the elements with these itemprops
+  parse_only = SoupStrainer(attrs={'itemprop': ['name', 'recipeIngredient']})
+
+  def listing_pages(self):
+    return [(a, f"/ar/buscar/argentina?page={a}") for a in range(0,13)]
+
+  # Listing pages link to recipes with paths relative to the site
+  def canonical_url(self, href):
+    return f'{self.site_url}{href}'
+
+  def file_name(self, url):
+    return f'{url.replace("https://cookpad.com/ar/recetas/","")}.html'
+
+  def extract(self, soup, file_name):
+    ingredients = []
+    title = format_title(soup.find('h1', itemprop='name'))
+    recipeIngredients = soup.find_all('div', itemprop='recipeIngredient')
+
+    for recipeIngredient in recipeIngredients:
+      # Extract and clean ingredient text
+      ingredient_text = unidecode(recipeIngredient.contents[2].strip().lower())
+
+      for ing in normalizer.normalize(ingredient_text):
+        if ing not in ingredients:
+          ingredients.append(ing)
+
+    return { "title": title, "ingredients": ingredients, "url": 'https://cookpad.com/ar/recetas/' + file_name.replace('.html', '') }
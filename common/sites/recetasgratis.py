@@ -0,0 +1,43 @@
+# Recetas Gratis (recetasgratis.net)
+from bs4 import SoupStrainer  # For parsing only the parts of a page the extractor reads
+from unidecode import unidecode  # For converting Unicode characters to ASCII
+from common.extractors import normalizer, format_title
+from common.sites.base import Site, register
+
+@register
+class RecetasGratis(Site):
+  name = 'recetasgratis'
+  site_url = 'https://www.recetasgratis.net'
+  listing_link = ("a", "titulo titulo--resultado")
+  recipe_marker = ("h1", "titulo titulo--articulo")
+  recipe_url_pattern = r'^https://www\.recetasgratis\.net/(receta|articulo)-[^/]+-\d+\.html$'
+  # Title and ingredient list items
+  parse_only = SoupStrainer(['h1', 'li'])
+
+  def listing_pages(self):
+    return [(a, f"/recetas-argentinas{f'/{a}' if a > 0 else ''}") for a in range(0,7)]
+
+  def file_name(self, url):
+    return f'{url.replace("https://www.recetasgratis.net/","")}.html'
+
+  def extract(self, soup, file_name):
+    ingredients = []
+    title = format_title(soup.find('h1', class_='titulo titulo--articulo'))
+    recipeIngredients = soup.find_all('li', class_='ingrediente')
+    recipeIngredients = [li for li in recipeIngredients if 'titulo' not in li.get('class')]
+
+    for recipeIngredient in recipeIngredients:
+
+      label = recipeIngredient.find('label')
+      if label:
+          label = label.text
+          lines = [line.strip() for line in label.strip().split('\n') if line.strip()]
+          label = lines[0] if lines else None
+          if label:
+            ingredient_text = unidecode(label.strip().lower())
+
+            for ing in normalizer.normalize(ingredient_text, strip=False):
+              if ing not in ingredients:
+                ingredients.append(ing)
+
+    return { "title": title, "ingredients": ingredients, "url": 'https://www.recetasgratis.net/' + file_name.replace('.html', '') }
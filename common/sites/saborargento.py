@@ -0,0 +1,55 @@
+# Sabor Argento (saborargento.com.ar)
+from bs4 import SoupStrainer  # For parsing only the parts of a page the extractor reads
+from unidecode import unidecode  # For converting Unicode characters to ASCII
+from common.extractors import normalizer, format_title
+from common.sites.base import Site, register
+
+@register
+class SaborArgento(Site):
+  name = 'saborargento'
+  site_url = 'https://saborargento.com.ar'
+  listing_link = ("a", "post-item post-grid-item vertical")
+  recipe_marker = ("h2", "wp-block-heading js-toc-item")
+  recipe_url_pattern = r'^https://saborargento\.com\.ar/[^/]+/[^/]+/$'
+  # The article holds the title and the ingredient lists between their headings
+  parse_only = SoupStrainer('article')
+
+  # Recipes are discovered from the homepage only
+  def listing_pages(self):
+    return [(0, "/")]
+
+  def listing_file_name(self, page):
+    return 'output-saborargento.json'
+
+  def file_name(self, url):
+    return f'{url.replace("https://saborargento.com.ar/","").replace("/", "|")}.html'
+
+  def extract(self, soup, file_name):
+    ingredients = []
+    title = format_title(soup.find('h1'))
+
+    # Find the starting <h3> tag
+    start_tag = soup.find('h3', id="✍-ingredientes-de-del-nombre-de-receta")
+
+    # Find the ending <h3> tag
+    end_tag = soup.find('h3', id="🥘-como-hacer-nombre-de-receta")
+
+    # Extract all <li> tags between these two
+    items = []
+    for tag in start_tag.find_next_siblings():
+        if tag == end_tag:
+            break
+        if tag.name == 'ul':
+            items.extend(tag.find_all('li'))
+
+    # Extract the text from each <li> tag
+    items_text = [item.text for item in items]
+
+    for item in items_text:
+      ingredient_text = unidecode(item.strip().lower())
+
+      for ing in normalizer.normalize(ingredient_text):
+        if ing not in ingredients:
+          ingredients.append(ing)
+
+    return { "title": title, "ingredients": ingredients, "url": 'https://saborargento.com.ar/' + file_name.replace('.html', '') }
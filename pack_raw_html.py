@@ -0,0 +1,33 @@
+# Migrate the loose raw HTML files of every site into pack files (see common/pack.py)
+import hashlib
+import os
+from common.pack import Pack
+
+directories = [
+  "/raw/cookpad-html",
+  "/raw/recetasgratis-html",
+  "/raw/saborargento-html"
+]
+
+# Pack every file of a directory into <directory>.pack, skipping the ones already packed with the same content
+def migrate(html_files_directory):
+  pack = Pack(html_files_directory + '.pack')
+  packed = 0
+  for file_name in sorted(os.listdir(html_files_directory)):
+    with open(os.path.join(html_files_directory, file_name), 'rb') as file:
+      data = file.read()
+    if pack.content_hash(file_name) != hashlib.sha256(data).hexdigest():
+      pack.write(file_name, data, sync=False)
+      packed += 1
+
+  pack.save_index()
+  pack.close()
+  loose_size = sum(os.path.getsize(os.path.join(html_files_directory, file_name)) for file_name in os.listdir(html_files_directory))
+  print(html_files_directory, f'{packed} files packed,', f'{loose_size} bytes loose,', f'{os.path.getsize(pack.path)} bytes packed')
+
+def start():
+  for dir in directories:
+    migrate(dir)
+
+if __name__ == "__main__":
+  start()
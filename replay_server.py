@@ -0,0 +1,119 @@
+# Local replay server for the raw HTML corpus, to run and benchmark the scraper without touching the real sites.
+# Every registered site is served under /<site name>: its recipe pages from raw/<site>-html(.pack), and synthetic
+# listing pages, robots.txt and sitemap.xml built from the urls in raw/<site>-urls. Point the scraper at it with
+# python 0_scraping.py --base-url http://127.0.0.1:8080
+import argparse
+import asyncio
+import json
+import os
+import random
+from aiohttp import web
+from common.pack import open_pack, read_page
+from common.sites import SITES
+
+raw_directory = '/raw'
+
+# Pages of one site, read from its pack if it has one, or else from the loose HTML files
+class SitePages:
+  def __init__(self, site):
+    self.site = site
+    html_files_directory = os.path.join(raw_directory, f'{site.name}-html')
+    self.pack = open_pack(html_files_directory)
+    self.directory = html_files_directory
+    self.listings = {}
+    self.urls = []
+    urls_directory = os.path.join(raw_directory, f'{site.name}-urls')
+    for number, path in site.listing_pages():
+      listing_file = os.path.join(urls_directory, site.listing_file_name(number))
+      if os.path.exists(listing_file):
+        with open(listing_file, 'r', encoding='utf-8') as file:
+          self.listings[path] = json.load(file)
+          self.urls.extend(site.canonical_url(href) for href in self.listings[path])
+
+  def read(self, name):
+    # Some saved file names lost the '|' that stands for '/' in saborargento urls
+    for candidate in (name, name.replace('|', '')):
+      page = read_page(self.directory, candidate, self.pack)
+      if page is not None:
+        return page
+    return None
+
+  def listing_html(self, path):
+    tag, class_ = self.site.listing_link
+    links = ''.join(f'<{tag} class="{class_}" href="{href}">{href}</{tag}>\n' for href in self.listings.get(path, []))
+    return f'<html><body>\n{links}</body></html>'
+
+  def sitemap_xml(self):
+    entries = ''.join(f'<url><loc>{url}</loc></url>\n' for url in self.urls)
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{entries}</urlset>'
+
+# Network conditions to simulate: latency (mean seconds before the first byte, with +-50% jitter),
+# bandwidth (bytes per second per response, 0 for unlimited) and error_rate (share of 503 answers)
+class Conditions:
+  def __init__(self, latency=0.0, bandwidth=0, error_rate=0.0, seed=0):
+    self.latency = latency
+    self.bandwidth = bandwidth
+    self.error_rate = error_rate
+    self.random = random.Random(seed)
+
+async def send(request, conditions, body, content_type):
+  if conditions.latency:
+    await asyncio.sleep(conditions.latency * conditions.random.uniform(0.5, 1.5))
+  if conditions.error_rate and conditions.random.random() < conditions.error_rate:
+    return web.Response(status=503, text='Service Unavailable')
+  if not conditions.bandwidth:
+    return web.Response(body=body, content_type=content_type)
+
+  # Trickle the body out in 10 chunks per second to simulate the bandwidth
+  response = web.StreamResponse(headers={'Content-Type': f'{content_type}; charset=utf-8'})
+  response.content_length = len(body)
+  await response.prepare(request)
+  chunk_size = max(1, conditions.bandwidth // 10)
+  for i in range(0, len(body), chunk_size):
+    await response.write(body[i:i + chunk_size])
+    await asyncio.sleep(0.1)
+  await response.write_eof()
+  return response
+
+def make_app(conditions):
+  pages = { site.name: SitePages(site) for site in SITES.values() }
+
+  async def handle(request):
+    site_name, _, rest = request.path_qs.lstrip('/').partition('/')
+    if site_name not in pages:
+      raise web.HTTPNotFound()
+    site_pages = pages[site_name]
+    site = site_pages.site
+    path = '/' + rest
+
+    if path == '/robots.txt':
+      return await send(request, conditions, f'User-agent: *\nSitemap: {request.url.origin()}/{site_name}/sitemap.xml\n'.encode(), 'text/plain')
+    if path == '/sitemap.xml':
+      return await send(request, conditions, site_pages.sitemap_xml().encode(), 'application/xml')
+    if path in site_pages.listings:
+      return await send(request, conditions, site_pages.listing_html(path).encode(), 'text/html')
+
+    body = site_pages.read(site.file_name(site.site_url + path))
+    if body is None:
+      raise web.HTTPNotFound()
+    return await send(request, conditions, body, 'text/html')
+
+  app = web.Application()
+  app.router.add_get('/{tail:.*}', handle)
+  return app
+
+def start(host='127.0.0.1', port=8080, latency=0.0, bandwidth=0, error_rate=0.0, seed=0):
+  web.run_app(make_app(Conditions(latency, bandwidth, error_rate, seed)), host=host, port=port)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds before each response')
+  parser.add_argument('--bandwidth', type=int, default=0, help='Bytes per second per response, 0 for unlimited')
+  parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 503')
+  parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated latency and errors')
+  parser.add_argument('--raw-directory', default=raw_directory)
+  args = parser.parse_args()
+  raw_directory = args.raw_directory
+  start(args.host, args.port, args.latency, args.bandwidth, args.error_rate, args.seed)
@@ -0,0 +1,143 @@
+# Proposes replacement rules for near-duplicate ingredient names ("aceite oliva", "aceite de oliva") in the format of
+# common/replacements.py, to be reviewed and pasted there by hand.
+#
+# Comparing every name with every other is quadratic, so candidate pairs come from a MinHash LSH index instead: each
+# name is a set of character 3-grams, its MinHash signature estimates the Jaccard similarity of those sets, and only
+# names that share all the rows of at least one band of their signatures are compared. Signatures are computed with
+# NumPy one hash function at a time over all the names, and candidate pairs are scored in one vectorized pass.
+import argparse
+import random
+import sys
+import time
+import zlib
+import numpy as np
+from common.matrix import load_vocabulary
+
+# Largest prime below 2 ** 32, for the (a * x + b) % PRIME hash functions, so hashed values fit in 32 bits
+PRIME = 4294967291
+
+# Character 3-grams of a name, padded with spaces so the first and last letters count as much as the others
+def shingles(name):
+  padded = f' {name} '
+  return { padded[i:i + 3] for i in range(len(padded) - 2) }
+
+# MinHash signatures (names x hashes, uint32) of the shingle sets of the names. The shingle hashes are reduced
+# modulo PRIME and a is kept below 2 ** 31, so a * x + b stays below 2 ** 64 and never wraps in uint64.
+def signatures(shingle_sets, hashes, seed):
+  values = np.array([zlib.crc32(shingle.encode('utf-8')) % PRIME for shingle_set in shingle_sets for shingle in shingle_set], dtype=np.uint64)
+  starts = np.cumsum([0] + [len(shingle_set) for shingle_set in shingle_sets[:-1]])
+  generator = np.random.default_rng(seed)
+  a = generator.integers(1, 2 ** 31, size=hashes, dtype=np.uint64)
+  b = generator.integers(0, PRIME, size=hashes, dtype=np.uint64)
+  result = np.empty((len(shingle_sets), hashes), dtype=np.uint32)
+  for k in range(hashes):
+    result[:, k] = np.minimum.reduceat((a[k] * values + b[k]) % PRIME, starts)
+  return result
+
+# Every pair (i < j) of members of the buckets, as packed i * n + j keys. Buckets of the same size are
+# expanded together: their members form a matrix whose column pairs are the upper triangle indices.
+def bucket_pairs(order, ends, counts, n, max_bucket):
+  keys = []
+  for size in np.unique(counts[(counts > 1) & (counts <= max_bucket)]):
+    starts = ends[counts == size] - size
+    members = np.sort(order[starts[:, None] + np.arange(size)], axis=1).astype(np.int64)
+    upper_i, upper_j = np.triu_indices(size, 1)
+    keys.append((members[:, upper_i] * n + members[:, upper_j]).ravel())
+  return np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+
+# Candidate pairs (i < j, as two arrays) of names that share a whole band of their signatures.
+# Buckets larger than max_bucket (very common shingles in short names) are skipped, as they say little.
+def candidate_pairs(signature, bands, max_bucket):
+  n, hashes = signature.shape
+  rows = hashes // bands
+  candidates = np.empty(0, dtype=np.int64)
+  for band in range(bands):
+    block = np.ascontiguousarray(signature[:, band * rows:(band + 1) * rows])
+    _, bucket, counts = np.unique(block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel(), return_inverse=True, return_counts=True)
+    order = np.argsort(bucket.ravel(), kind='stable')
+    candidates = np.union1d(candidates, bucket_pairs(order, np.cumsum(counts), counts, n, max_bucket))
+  return candidates // n, candidates % n
+
+# Estimated Jaccard similarity of every candidate pair: the share of hash functions whose minimums agree.
+# Computed in chunks so the compared signature rows never take much memory.
+def similarities(signature, first, second, chunk=100000):
+  result = np.empty(len(first))
+  for start in range(0, len(first), chunk):
+    end = start + chunk
+    result[start:end] = (signature[first[start:end]] == signature[second[start:end]]).mean(axis=1)
+  return result
+
+# Replacement rules for the pairs at or above the threshold: every name with a similar name used by more recipes is
+# replaced by its most similar such name. Groups are not merged transitively, as chains of similar names drift
+# ("ralladura de naranja", "ralladura de limon"). Rules whose target contains their source are left out, as applying
+# them with str.replace would grow the name again every time it is found inside the target.
+def propose_rules(names, document_frequency, first, second, similarity, threshold):
+  best = {}
+  keep = similarity >= threshold
+  for i, j, score in zip(first[keep].tolist(), second[keep].tolist(), similarity[keep].tolist()):
+    # The less used name of the pair (the longer one on ties) is the one to replace
+    source, target = (i, j) if (document_frequency[i], -len(names[i])) < (document_frequency[j], -len(names[j])) else (j, i)
+    if names[source] in names[target]:
+      continue
+    if source not in best or (score, document_frequency[target]) > best[source][1:]:
+      best[source] = (target, score, document_frequency[target])
+
+  rules = [(names[source], names[target], score) for source, (target, score, _) in best.items()]
+  return sorted(rules, key=lambda rule: (-rule[2], rule[0]))
+
+# Synthetic vocabulary of count names made by adding, dropping and swapping words of the real ones, to check the
+# tool's scaling on a vocabulary far larger than the corpus
+def synthetic_names(names, count, seed):
+  generator = random.Random(seed)
+  words = [word for name in names for word in name.split()]
+  result = set(names)
+  while len(result) < count:
+    parts = generator.choice(names).split()
+    operation = generator.random()
+    if operation < 0.4:
+      parts.insert(generator.randrange(len(parts) + 1), generator.choice(words))
+    elif operation < 0.7 and len(parts) > 1:
+      parts.pop(generator.randrange(len(parts)))
+    else:
+      parts[generator.randrange(len(parts))] = generator.choice(words)
+    result.add(' '.join(parts))
+  return sorted(result)
+
+def start(vocabulary_file, threshold=0.7, hashes=64, bands=16, max_bucket=50, synthetic=0, seed=0, output=None):
+  names, document_frequency = load_vocabulary(vocabulary_file)
+  if synthetic:
+    names = synthetic_names(names, synthetic, seed)
+    document_frequency = np.ones(len(names), dtype=np.int32)
+
+  started = time.perf_counter()
+  shingle_sets = [sorted(shingles(name)) for name in names]
+  signature = signatures(shingle_sets, hashes, seed)
+  first, second = candidate_pairs(signature, bands, max_bucket)
+  similarity = similarities(signature, first, second)
+  rules = propose_rules(names, document_frequency, first, second, similarity, threshold)
+  elapsed = time.perf_counter() - started
+
+  all_pairs = len(names) * (len(names) - 1) // 2
+  print(f'{len(names)} names, {len(first)} candidate pairs ({len(first) / max(all_pairs, 1):.4%} of all pairs), '
+        f'{len(rules)} rules in {elapsed:.1f}s', file=sys.stderr)
+
+  lines = [f'      [{source!r}, {target!r}],  # {score:.2f}\n' for source, target, score in rules]
+  if output:
+    with open(output, 'w', encoding='utf-8') as f:
+      f.writelines(lines)
+  else:
+    sys.stdout.writelines(lines)
+  return rules
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--vocabulary', default='/formatted/ingredient-vocabulary.json', help='Vocabulary written by the cleaning stage')
+  parser.add_argument('--threshold', type=float, default=0.7, help='Minimum estimated Jaccard similarity of the 3-grams of two names')
+  parser.add_argument('--hashes', type=int, default=64, help='Number of MinHash functions')
+  parser.add_argument('--bands', type=int, default=16, help='Number of LSH bands the signatures are split into')
+  parser.add_argument('--max-bucket', type=int, default=50, help='Skip LSH buckets with more names than this')
+  parser.add_argument('--synthetic', type=int, default=0, help='Run on a synthetic vocabulary of this many names derived from the real one')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='Write the rules to this file instead of the standard output')
+  args = parser.parse_args()
+  start(args.vocabulary, args.threshold, args.hashes, args.bands, args.max_bucket, args.synthetic, args.seed, args.output)
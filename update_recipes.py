@@ -0,0 +1,103 @@
+# Updates the outputs of the cleaning (formatted recipes, ingredient vocabulary and recipe x ingredient matrix),
+# pairing, recommendation matrix (and its top neighbour lists) and tf-idf stages for a few added or removed recipes
+# without running those stages over the whole corpus again. The counts are kept in formatted/cooccurrence-index.json,
+# built from the formatted recipes the first time, and again whenever the recipes file is not the one the index was
+# last in step with (a full run of the cleaning stage rewrote it) or with --rebuild.
+#
+# Only the counts are updated as a delta. The output files are whole JSON (and .npz) documents read by the later
+# stages and the web app, so each one is still written again, in one pass over its contents: the formatted recipes
+# are streamed through with the delta applied, and the pairs are sorted once and shared by the other outputs.
+# Nothing is written when the delta changes nothing.
+#
+# python update_recipes.py --add new-recipes.jsonl --remove old-recipes.jsonl
+import argparse
+import importlib
+import json
+import os
+import time
+from common.incremental import CooccurrenceIndex
+from common.matrix import read_json_array, read_recipes, write_artifacts
+
+cleaning = importlib.import_module('1_cleaning_and_formatting_recipes')
+pairing = importlib.import_module('2_pairing_ingredients')
+matrix_stage = importlib.import_module('3_recommendation_matrix')
+
+# Recipe records of a JSON lines file or a JSON array file
+def read_records(records_file):
+  with open(records_file, 'r', encoding='utf-8') as file:
+    is_array = file.read(1) == '['
+  return list(read_json_array(records_file) if is_array else read_recipes(records_file))
+
+# The added recipes as the index keeps them: a url added more than once only keeps its last recipe, at its position
+def latest_records(added):
+  latest = {}
+  for recipe in added:
+    latest.pop(recipe["url"], None)
+    latest[recipe["url"]] = recipe
+  return list(latest.values())
+
+# Apply the delta to the formatted recipes, in the order of the index (the removed and replaced recipes dropped, the
+# added ones at the end), and write the JSON array, vocabulary and matrix of the cleaning stage from them again
+def update_formatted(added, removed):
+  base_name = os.path.join(pairing.formatted_directory, 'formatted-recipes')
+  dropped = { recipe["url"] for recipe in removed } | { recipe["url"] for recipe in added }
+  with open(base_name + '.jsonl.tmp', 'w') as f:
+    for recipe in pairing.stream_recipes():
+      if recipe["url"] not in dropped:
+        f.write(json.dumps(recipe) + '\n')
+    for recipe in latest_records(added):
+      f.write(json.dumps(recipe) + '\n')
+  os.replace(base_name + '.jsonl.tmp', base_name + '.jsonl')
+  write_artifacts(base_name + '.jsonl', os.path.join(pairing.formatted_directory, 'ingredient-vocabulary.json'), os.path.join(pairing.formatted_directory, 'recipe-ingredients.npz'))
+  cleaning.compact(base_name + '.jsonl', base_name + '.json')
+
+# Size and modification time of the recipes file the stages read, to tell whether something else rewrote it
+def recipes_fingerprint():
+  source = pairing.recipes_file()
+  stat = os.stat(source)
+  return [os.path.basename(source), stat.st_size, stat.st_mtime_ns]
+
+def start(added_file=None, removed_file=None, rebuild=False, top_k=10):
+  index_file = os.path.join(pairing.formatted_directory, 'cooccurrence-index.json')
+  index = None
+  if not rebuild and os.path.exists(index_file):
+    index = CooccurrenceIndex.load(index_file)
+    if index.source != recipes_fingerprint():
+      print('The formatted recipes changed since the index was saved, building it again')
+      index = None
+  built = index is None
+  if built:
+    index = CooccurrenceIndex.from_recipes(pairing.stream_recipes())
+
+  added = read_records(added_file) if added_file else []
+  removed = [recipe for recipe in read_records(removed_file) if recipe["url"] in index.recipes] if removed_file else []
+  started = time.perf_counter()
+  affected = index.update(added, removed)
+  print(f'{len(affected)} ingredient rows updated in {time.perf_counter() - started:.3f}s, {len(index.recipes)} recipes, {len(index.counts)} pairs')
+  if not (added or removed or built):
+    return
+  if added or removed:
+    update_formatted(added, removed)
+  index.source = recipes_fingerprint()
+  index.save(index_file)
+
+  pairs = index.pairs()
+  pairing.write_pairs(pairs, os.path.join(pairing.formatted_directory, 'ingredient-pairs.json'))
+  matrix = index.recommendation_matrix(pairs)
+  with open(os.path.join(pairing.formatted_directory, 'ingredient-recomendation-matrix.json'), 'w') as f:
+    json.dump(matrix, f, indent=4)
+  with open(os.path.join(pairing.formatted_directory, 'ingredient-recomendation-top.json'), 'w') as f:
+    json.dump(matrix_stage.top_neighbours(matrix, top_k), f)
+  with open(os.path.join(pairing.formatted_directory, 'ingredient-pairs-tfidf.json'), 'w') as f:
+    json.dump(index.tf_idf_pairs(pairs), f, indent=4)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--add', help='JSON lines or JSON array file of the recipes to add (or replace, by url)')
+  parser.add_argument('--remove', help='JSON lines or JSON array file of the recipes to remove, by url')
+  parser.add_argument('--rebuild', action='store_true', help='Build the index again from the formatted recipes first')
+  parser.add_argument('--top-k', type=int, default=10, help='Neighbours kept per ingredient in ingredient-recomendation-top.json')
+  parser.add_argument('--formatted-directory', default=pairing.formatted_directory)
+  args = parser.parse_args()
+  pairing.formatted_directory = args.formatted_directory
+  start(args.add, args.remove, args.rebuild, args.top_k)
@@ -1,12 +1,43 @@
 // Importing necessary data files
 import pairings from './ingredient-recomendation-matrix.json';
+import topNeighbours from './ingredient-recomendation-top.json';
 import formattedRecipes from './formatted-recipes.json';
 import USDA from './usda-foundation-ingredients.json';
 import ingredientToUsda from './ingredient-to-usda-foundation.json';
 import clasificacionDulceSalado from './clasificacion-ingredientes-dulce-salado.json';
 
-// Function to recommend ingredients based on user input
+// Order of [ingredient, score] recommendations: highest score first, ties by name, so both ways of
+// computing them recommend the same ingredients in the same order
+function byScoreThenName(a, b) {
+    return b[1] - a[1] || (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0);
+}
+
+// Function to recommend ingredients based on user input. The candidates are the precomputed top neighbours of each
+// selected ingredient, scored with the matrix cells; an ingredient outside every list scores at most the sum of the
+// last counts of the lists, so only when a top three candidate does not beat that are the whole rows walked.
 export function recommendIngredient(userIngredients) {
+    const candidates = {};
+    let unseenBound = 0;
+    userIngredients.forEach(ingredient => {
+        const neighbours = topNeighbours[ingredient];
+        if (!neighbours || !neighbours.length) return;
+        neighbours.forEach(([pair]) => {
+            if (!userIngredients.includes(pair)) {
+                candidates[pair] = userIngredients.reduce((score, selected) => score + ((pairings[selected] || {})[pair] || 0), 0);
+            }
+        });
+        unseenBound += neighbours[neighbours.length - 1][1];
+    });
+
+    const recommended = Object.entries(candidates).sort(byScoreThenName).slice(0, 3);
+    if (recommended.length === 3 && recommended[2][1] > unseenBound) {
+        return recommended.map(x => x[0]);
+    }
+    return recommendIngredientFromRows(userIngredients);
+}
+
+// Function to recommend ingredients walking the whole matrix rows of the user's ingredients
+function recommendIngredientFromRows(userIngredients) {
     // Initialize an empty object to store ingredient recommendations
     const recommendations = {};
 
@@ -24,8 +55,8 @@ export function recommendIngredient(userIngredients) {
         }
     });
 
-    // Sort recommendations by count in descending order and return the top three
-    const recommended = Object.entries(recommendations).sort((a, b) => b[1] - a[1]).slice(0, 3);
+    // Sort recommendations by count in descending order (then by name) and return the top three
+    const recommended = Object.entries(recommendations).sort(byScoreThenName).slice(0, 3);
     // Return recommended ingredients or null if none found
     return recommended && recommended.length ? recommended.map(x => x[0]) : null;
 }